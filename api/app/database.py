@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from pathlib import Path
+import orjson
 
 env_path = Path(__file__).resolve().parents[2] / "config" / ".env"
 if env_path.exists():
@@ -13,7 +14,21 @@ DB_URL = os.getenv("DB_URL")
 if not DB_URL:
     raise RuntimeError("DB_URL not set in config/.env")
 
-engine = create_engine(DB_URL, pool_pre_ping=True, future=True)
+# /api/sms/enable and friends wait on Twilio, so size the pool above the
+# default 5+10 and recycle before MySQL's wait_timeout drops idle connections
+engine = create_engine(
+    DB_URL,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")),
+    pool_pre_ping=True,
+    # JSON columns (payloads, ledger details, pricing snapshots) via orjson;
+    # OPT_NON_STR_KEYS keeps json.dumps' handling of int dict keys
+    json_serializer=lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode(),
+    json_deserializer=orjson.loads,
+    future=True,
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
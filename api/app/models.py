@@ -55,9 +55,9 @@ class AccountSmsSettings(Base):
         server_default=text("'email'"),
     )  # email|sms|both
 
-    twilio_phone_number = Column(String(30), nullable=True)
+    twilio_phone_number = Column(String(30), nullable=True, index=True)
     twilio_phone_sid = Column(String(64), nullable=True)
-    twilio_subaccount_sid = Column(String(64), nullable=True)
+    twilio_subaccount_sid = Column(String(64), nullable=True, index=True)
     twilio_auth_token_enc = Column(String(255), nullable=True)
     twilio_bundle_sid = Column(String(64), nullable=True)
 
@@ -94,6 +94,12 @@ class SmsPricingSettings(Base):
 class SmsCreditLedger(Base):
     __tablename__ = "sms_credit_ledger"
 
+    __table_args__ = (
+        Index("ix_sms_credit_ledger_user_type", "user_id", "entry_type"),
+        # one debit per Twilio message SID; credits leave reference_id NULL
+        UniqueConstraint("user_id", "entry_type", "reference_id", name="uq_sms_credit_ledger_ref"),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
 
@@ -170,6 +176,8 @@ class Invoice(Base):
         Index("ix_invoices_customer_invoice_number", "customer_id", "invoice_number"),
         # Scope by owner
         Index("ix_invoices_user", "user_id"),
+        # Statement ledger/summary: a customer's invoices up to a date
+        Index("ix_invoices_customer_issue", "customer_id", "issue_date"),
     )
 
     id               = Column(Integer, primary_key=True, autoincrement=True)
@@ -217,6 +225,10 @@ class Invoice(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Statement ledger/summary: a customer's payments up to a date
+        Index("ix_payments_customer_received", "customer_id", "received_at"),
+    )
     id            = Column(Integer, primary_key=True)
     kind          = Column(PAYMENT_KIND_ENUM, nullable=False, default="payment")
     customer_id   = Column(Integer, ForeignKey("customers.id"), nullable=True)
@@ -317,6 +329,10 @@ class InvoiceUploadPreset(Base):
 
 class PaymentAllocation(Base):
     __tablename__ = "payment_allocations"
+    __table_args__ = (
+        # Covering index for the statement allocation sums (per payment -> invoice, amount)
+        Index("ix_payment_allocations_payment_cover", "payment_id", "invoice_id", "amount"),
+    )
     id = Column(Integer, primary_key=True)
     payment_id = Column(Integer, ForeignKey("payments.id"), nullable=False, index=True)
     invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True)
@@ -366,6 +382,11 @@ class VerificationToken(Base):
 class ReminderRule(Base):
     __tablename__ = "reminder_rules"
 
+    __table_args__ = (
+        # enqueue-due: keeps the FOR UPDATE SKIP LOCKED scan (and its locks) to due rules
+        Index("ix_reminder_rules_due", "reminder_type", "reminder_enabled", "reminder_next_run_utc"),
+    )
+
     id                   = Column(Integer, primary_key=True, autoincrement=True)
     user_id              = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     name                 = Column(String(100), nullable=False)
@@ -486,6 +507,8 @@ class EmailOutbox(Base):
     __table_args__ = (
         Index("ix_outbox_status_next", "status", "next_attempt_at"),
         Index("ix_outbox_user_status", "user_id", "status"),
+        # one statement job per customer per run (NULL run_id rows never collide)
+        UniqueConstraint("run_id", "customer_id", name="uq_outbox_run_customer"),
     )
 
 class DeliveryEvent(Base):
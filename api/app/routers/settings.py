@@ -1,14 +1,21 @@
 ﻿# app/routers/settings.py
 from __future__ import annotations
 import os
+import re
+import tempfile
 from pathlib import Path
 from typing import Optional, List
 from datetime import time as dtime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from fastapi import Depends, UploadFile, File
+from fastapi import Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel, validator
 from zoneinfo import available_timezones
+import orjson
 
 from ..shared import APIRouter
 from ..database import get_db
@@ -16,17 +23,41 @@ from ..models import AppSettings
 from .auth import require_user
 from ..initial_user_setup import run_initial_user_setup
 
-router = APIRouter(prefix="/api/settings", tags=["settings"])
+router = APIRouter(prefix="/api/settings", tags=["settings"], default_response_class=ORJSONResponse)
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 STATIC_DIR   = PROJECT_ROOT / "web" / "static"
+_UPLOADS_ROOT = os.path.join(str(STATIC_DIR), "uploads")
+
+# tzdata doesn't change while the process is running; enumerate it once.
+_TZ_SET = frozenset(available_timezones())
+_TZ_SORTED = tuple(sorted(_TZ_SET))
+_TZ_JSON = orjson.dumps(_TZ_SORTED)
+
+_HEX_COLOR_RE = re.compile(r"^#[0-9a-fA-F]{6}$")
+_HHMM_RE = re.compile(r"([01]?[0-9]|2[0-3]):([0-5]?[0-9])")  # 'H:M' .. 'HH:MM'
+
+_CHASE_STYLES = frozenset({"gentle", "firm", "aggressive", "custom"})
+_CURRENCIES = frozenset({"GBP", "USD", "EUR"})
+_LOGO_EXTS = frozenset({".png", ".jpg", ".jpeg", ".gif", ".webp"})
+
+_UPLOAD_CHUNK = 1 << 20          # stream uploads in 1 MiB chunks
+_LOGO_MAX_BYTES = 5 * (1 << 20)  # refuse logos larger than 5 MiB
 
 # ---------- helpers ----------
 def _get_for_user(db, user_id: int) -> AppSettings:
     s = db.query(AppSettings).filter(AppSettings.user_id == user_id).first()
-    if not s:
-        s = AppSettings(user_id=user_id)  # DB defaults will fill in
-        db.add(s); db.commit(); db.refresh(s)
+    if s:
+        return s
+    s = AppSettings(user_id=user_id)  # DB defaults will fill in
+    db.add(s)
+    try:
+        db.commit()
+    except IntegrityError:
+        # a concurrent request created the row first (user_id is unique)
+        db.rollback()
+        return db.query(AppSettings).filter(AppSettings.user_id == user_id).one()
+    db.refresh(s)
     return s
 
 def _sanitize_time_format(v: Optional[str]) -> str:
@@ -40,25 +71,19 @@ def _sanitize_date_locale(v: Optional[str]) -> str:
 def _sanitize_country(v: Optional[str]) -> str:
     return (v or "GB").upper()[:2]
 
-def _sanitize_timezone(v: Optional[str]) -> str:
-    tz = (v or "").strip() or "UTC"
-    return tz if tz in available_timezones() else "UTC"
-
 def _sanitize_hhmm(v: Optional[str]) -> str:
     s = (v or "").strip()
-    if ":" in s:
-        hh, mm = s.split(":", 1)
-        if hh.isdigit() and mm.isdigit():
-            h, m = int(hh), int(mm)
-            if 0 <= h <= 23 and 0 <= m <= 59:
-                return f"{h:02d}:{m:02d}"
-    return "14:00"
+    m = _HHMM_RE.fullmatch(s)
+    if not m:
+        return "14:00"
+    if len(s) == 5:
+        return s  # already canonical 'HH:MM'
+    return f"{int(m.group(1)):02d}:{int(m.group(2)):02d}"
 
 def _parse_hhmm_to_time(v: Optional[str]) -> dtime:
     """'HH:MM' -> datetime.time"""
     s = _sanitize_hhmm(v)
-    hh, mm = s.split(":")
-    return dtime(int(hh), int(mm))
+    return dtime(int(s[:2]), int(s[3:]))
 
 def _time_to_hhmm(v) -> str:
     """datetime.time | str | None -> 'HH:MM'"""
@@ -85,7 +110,7 @@ class SettingsIn(BaseModel):
     def _tz_ok(cls, v):
         if v is None:
             return v
-        if v not in available_timezones():
+        if v not in _TZ_SET:
             raise ValueError("Invalid timezone")
         return v
 
@@ -111,104 +136,147 @@ class SettingsOut(BaseModel):
     theme: Optional[str] = None
     brand_color: Optional[str] = None
 
+def _settings_to_out(s: AppSettings) -> SettingsOut:
+    # values come straight from our own row, so skip field validation
+    return SettingsOut.construct(
+        date_locale=s.date_locale,
+        time_format=s.time_format,
+        default_country=s.default_country or "GB",
+        currency=getattr(s, "currency", None) or "GBP",
+        org_address=s.org_address or "",
+        org_logo_url=s.org_logo_url or "",
+        timezone=s.timezone or "UTC",
+        default_send_time=_time_to_hhmm(getattr(s, "default_send_time", None)),
+        chase_style=getattr(s, "chase_style", "gentle") or "gentle",
+        theme=getattr(s, "theme", None),
+        brand_color=getattr(s, "brand_color", None),
+    )
+
 # ---------- routes ----------
 @router.get("", response_model=SettingsOut)
 def get_settings(db=Depends(get_db), user=Depends(require_user)):
     s = _get_for_user(db, user.id)
-    return {
-        "date_locale": s.date_locale,
-        "time_format": s.time_format,
-        "default_country": s.default_country or "GB",
-        "currency": getattr(s, "currency", None) or "GBP",
-        "org_address": s.org_address or "",
-        "org_logo_url": s.org_logo_url or "",
-        "timezone": s.timezone or "UTC",
-        "default_send_time": _time_to_hhmm(getattr(s, "default_send_time", None)),
-        "chase_style": getattr(s, "chase_style", "gentle") or "gentle",
-        "theme": getattr(s, "theme", None),
-        "brand_color": getattr(s, "brand_color", None),
-    }
+    return _settings_to_out(s)
 
 @router.post("", response_model=SettingsOut)
 def update_settings(body: SettingsIn, db=Depends(get_db), user=Depends(require_user)):
     s = _get_for_user(db, user.id)
+    updates: dict = {}
 
     if body.date_locale is not None:
-        s.date_locale = _sanitize_date_locale(body.date_locale)
+        updates["date_locale"] = _sanitize_date_locale(body.date_locale)
     if body.time_format is not None:
-        s.time_format = _sanitize_time_format(body.time_format)
+        updates["time_format"] = _sanitize_time_format(body.time_format)
     if body.default_country is not None:
-        s.default_country = _sanitize_country(body.default_country)
+        updates["default_country"] = _sanitize_country(body.default_country)
     if body.currency is not None:
         cur = (body.currency or "").upper().strip()
-        if cur in {"GBP","USD","EUR"}:
-            s.currency = cur
+        if cur in _CURRENCIES:
+            updates["currency"] = cur
     if body.org_address is not None:
-        s.org_address = (body.org_address or None)
+        updates["org_address"] = (body.org_address or None)
     if body.timezone is not None:
-        s.timezone = _sanitize_timezone(body.timezone)
+        updates["timezone"] = body.timezone  # already checked against _TZ_SET by _tz_ok
     if body.default_send_time is not None:
-        s.default_send_time = _parse_hhmm_to_time(body.default_send_time)
-    if body.chase_style in {"gentle","firm","aggressive","custom"}:
-        s.chase_style = body.chase_style
+        updates["default_send_time"] = _parse_hhmm_to_time(body.default_send_time)
+    if body.chase_style in _CHASE_STYLES:
+        s.chase_style = body.chase_style  # not a mapped column; only echoed back
 
     # theme + brand color
     if body.theme is not None:
-        s.theme = (body.theme or None)
+        updates["theme"] = (body.theme or None)
     if body.brand_color is not None:
         col = body.brand_color.strip() if isinstance(body.brand_color, str) else None
-        if col and len(col) == 7 and col.startswith('#') and all(c in '0123456789abcdefABCDEF' for c in col[1:]):
-            s.brand_color = col
+        if col and _HEX_COLOR_RE.match(col):
+            updates["brand_color"] = col
         elif not col:
-            s.brand_color = None
-
-    db.add(s); db.commit(); db.refresh(s)
-
-    return {
-        "date_locale": s.date_locale,
-        "time_format": s.time_format,
-        "default_country": s.default_country or "GB",
-        "currency": getattr(s, "currency", None) or "GBP",
-        "org_address": s.org_address or "",
-        "org_logo_url": s.org_logo_url or "",
-        "timezone": s.timezone or "UTC",
-        "default_send_time": _time_to_hhmm(s.default_send_time),
-        "chase_style": getattr(s, "chase_style", "gentle") or "gentle",
-        "theme": getattr(s, "theme", None),
-        "brand_color": getattr(s, "brand_color", None),
-    }
+            updates["brand_color"] = None
+
+    # one UPDATE with only the columns that actually change (none -> no write);
+    # the default synchronize_session keeps `s` in step for the response
+    updates = {k: v for k, v in updates.items() if getattr(s, k) != v}
+    if updates:
+        db.execute(update(AppSettings).where(AppSettings.id == s.id).values(**updates))
+
+    # build the response from the in-memory row before commit expires it,
+    # so returning it doesn't cost a reload SELECT
+    out = _settings_to_out(s)
+    db.commit()
+    return out
 
 @router.get("/timezones", response_model=List[str])
 def list_timezones():
-    return sorted(available_timezones())
+    # pre-encoded body; returning a Response skips response_model
+    # validation (kept above for the OpenAPI schema)
+    return Response(content=_TZ_JSON, media_type="application/json")
+
+def _open_logo_part(upload_dir: str):
+    """Temp file beside the live logo; the upload is staged here first."""
+    os.makedirs(upload_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix=".company_logo.", suffix=".part")
+    return os.fdopen(fd, "wb", buffering=_UPLOAD_CHUNK), tmp_path
+
+def _finish_logo_part(f, tmp_path: str, disk_path: Optional[str]) -> None:
+    """Close the staged upload and move it onto disk_path, or discard it when disk_path is None."""
+    kept = False
+    try:
+        f.close()
+        if disk_path is not None:
+            os.replace(tmp_path, disk_path)
+            kept = True
+    finally:
+        if not kept:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+def _save_logo_url(db, user_id: int, url_path: str) -> None:
+    s = _get_for_user(db, user_id)
+    s.org_logo_url = url_path
+    db.commit()
 
 @router.post("/logo")
-def upload_logo(file: UploadFile = File(...), db=Depends(get_db), user=Depends(require_user)):
-    upload_dir = STATIC_DIR / "uploads" / f"u{user.id}" / "logo"
-    upload_dir.mkdir(parents=True, exist_ok=True)
+async def upload_logo(file: UploadFile = File(...), db=Depends(get_db), user=Depends(require_user)):
+    upload_dir = os.path.join(_UPLOADS_ROOT, f"u{user.id}", "logo")
 
     _, ext = os.path.splitext(file.filename or "")
     ext = (ext or ".png").lower()
-    if ext not in {".png", ".jpg", ".jpeg", ".gif", ".webp"}:
+    if ext not in _LOGO_EXTS:
         ext = ".jpg"
 
-    disk_path = upload_dir / f"company_logo{ext}"
-    with open(disk_path, "wb") as f:
-        f.write(file.file.read())
+    # async handler: the upload is read chunk-by-chunk without holding a
+    # threadpool worker; every blocking file op and the DB work are offloaded.
+    # The temp file only replaces the live logo once the size check passes,
+    # so a rejected upload never touches the current logo.
+    filename = f"company_logo{ext}"
+    disk_path = os.path.join(upload_dir, filename)
+    f, tmp_path = await run_in_threadpool(_open_logo_part, upload_dir)
+    written = 0
+    accepted = False
+    try:
+        while True:
+            chunk = await file.read(_UPLOAD_CHUNK)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > _LOGO_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Logo must be 5 MB or smaller.")
+            await run_in_threadpool(f.write, chunk)
+        accepted = True
+    finally:
+        await run_in_threadpool(_finish_logo_part, f, tmp_path, disk_path if accepted else None)
 
-    rel = disk_path.relative_to(STATIC_DIR).as_posix()
-    url_path = f"/static/{rel}"
+    url_path = f"/static/uploads/u{user.id}/logo/{filename}"
 
-    s = _get_for_user(db, user.id)
-    s.org_logo_url = url_path
-    db.add(s); db.commit(); db.refresh(s)
-    return {"org_logo_url": s.org_logo_url}
+    await run_in_threadpool(_save_logo_url, db, user.id, url_path)
+    return {"org_logo_url": url_path}
 
 @router.delete("/logo")
 def delete_logo(db=Depends(get_db), user=Depends(require_user)):
     s = _get_for_user(db, user.id)
     s.org_logo_url = None
-    db.add(s); db.commit()
+    db.commit()
     return {"ok": True}
 
 @router.post("/restore_defaults")
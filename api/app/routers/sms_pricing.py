@@ -2,23 +2,18 @@
 from typing import Optional
 
 from fastapi import Depends
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from ..shared import APIRouter
 from ..database import get_db
 from ..models import SmsPricingSettings
+from ..services.sms_pricing_logic import ensure_pricing, invalidate_pricing_cache
 from .auth import require_owner
 
-router = APIRouter(prefix="/api/admin/sms_pricing", tags=["sms_pricing"])
-
-DEFAULT_PRICING = {
-    "sms_starting_credits": 1000,
-    "sms_monthly_number_cost": 100,
-    "sms_send_cost": 5,
-    "sms_forward_cost": 5,
-    "sms_suspend_after_days": 14,
-}
+router = APIRouter(prefix="/api/admin/sms_pricing", tags=["sms_pricing"], default_response_class=ORJSONResponse)
 
 class PricingOut(BaseModel):
     sms_starting_credits: int
@@ -35,23 +30,9 @@ class PricingIn(BaseModel):
     sms_suspend_after_days: Optional[int] = Field(None, ge=0)
 
 
-def _ensure_pricing(db: Session) -> SmsPricingSettings:
-    row = db.query(SmsPricingSettings).order_by(SmsPricingSettings.id.asc()).first()
-    if row:
-        return row
-    row = SmsPricingSettings(**DEFAULT_PRICING)
-    db.add(row)
-    db.commit()
-    db.refresh(row)
-    return row
-
-@router.get("", response_model=PricingOut)
-def get_pricing(
-    db: Session = Depends(get_db),
-    owner=Depends(require_owner),
-):
-    row = _ensure_pricing(db)
-    return PricingOut(
+def _pricing_to_out(row: SmsPricingSettings) -> PricingOut:
+    # values come straight from our own row, so skip field validation
+    return PricingOut.construct(
         sms_starting_credits=row.sms_starting_credits,
         sms_monthly_number_cost=row.sms_monthly_number_cost,
         sms_send_cost=row.sms_send_cost,
@@ -59,25 +40,33 @@ def get_pricing(
         sms_suspend_after_days=row.sms_suspend_after_days,
     )
 
+@router.get("", response_model=PricingOut)
+def get_pricing(
+    db: Session = Depends(get_db),
+    owner=Depends(require_owner),
+):
+    row = ensure_pricing(db)
+    return _pricing_to_out(row)
+
 @router.post("", response_model=PricingOut)
 def update_pricing(
     payload: PricingIn,
     db: Session = Depends(get_db),
     owner=Depends(require_owner),
 ):
-    row = _ensure_pricing(db)
+    row = ensure_pricing(db)
 
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(row, field, value)
+    # all pricing columns are NOT NULL, so an explicit null means "leave as is"
+    updates = {k: v for k, v in payload.dict(exclude_unset=True).items() if v is not None}
+    if updates:
+        db.execute(
+            update(SmsPricingSettings)
+            .where(SmsPricingSettings.id == row.id)
+            .values(**updates)
+        )
 
-    db.add(row)
+    # build the response from the in-memory row before commit expires it
+    out = _pricing_to_out(row)
     db.commit()
-    db.refresh(row)
-
-    return PricingOut(
-        sms_starting_credits=row.sms_starting_credits,
-        sms_monthly_number_cost=row.sms_monthly_number_cost,
-        sms_send_cost=row.sms_send_cost,
-        sms_forward_cost=row.sms_forward_cost,
-        sms_suspend_after_days=row.sms_suspend_after_days,
-    )
+    invalidate_pricing_cache()
+    return out
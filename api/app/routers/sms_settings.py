@@ -1,20 +1,42 @@
 # api/app/routers/sms_settings.py
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from typing import Optional, List
 
 from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import case, func
-from sqlalchemy.orm import Session
-import requests
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session, raiseload
 
 from ..shared import APIRouter
 from ..database import get_db
-from ..models import AccountSmsSettings, SmsCreditLedger, SmsPricingSettings
+from ..models import AccountSmsSettings, SmsCreditLedger
 from ..crypto_secrets import encrypt_secret
-from .auth import require_user
-router = APIRouter(prefix="/api/sms", tags=["sms_settings"])
+from ..services.sms_credits import add_ledger_entry
+from ..services.sms_pricing_logic import get_pricing_snapshot
+from ..services.twilio_http import twilio_http
+from .auth import require_owner, require_user
+router = APIRouter(prefix="/api/sms", tags=["sms_settings"], default_response_class=ORJSONResponse)
+
+_TWILIO_API = "https://api.twilio.com/2010-04-01"
+_TWILIO_BUNDLES_URL = "https://numbers.twilio.com/v2/RegulatoryCompliance/Bundles"
+_INBOUND_WEBHOOK_PATH = "/api/sms/webhooks/inbound"
+_STATUS_WEBHOOK_PATH = "/api/sms/webhooks/status"
+
+# shared by every /enable call; runs the subaccount auth-token lookup
+# alongside bundle/number provisioning
+_TOKEN_LOOKUPS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="twilio-token")
+
+# built once; SQLAlchemy's compiled cache then reuses the SQL on every call.
+# raiseload: these endpoints never need a relationship, so a lazy load is a bug
+_SMS_SETTINGS_BY_USER = (
+    select(AccountSmsSettings)
+    .where(AccountSmsSettings.user_id == bindparam("user_id"))
+    .options(raiseload("*"))
+)
 
 class SmsSettingsOut(BaseModel):
     enabled: bool
@@ -35,7 +57,6 @@ class SmsSettingsIn(BaseModel):
     forwarding_enabled: Optional[bool] = None
     forward_to_phone: Optional[str] = None
     bundle_size: Optional[int] = Field(None, ge=100, le=100000)
-    credits_balance: Optional[int] = Field(None, ge=0)
     free_credits: Optional[int] = Field(None, ge=0)
 
 class SmsTermsIn(BaseModel):
@@ -68,35 +89,33 @@ class LedgerOut(BaseModel):
     entries: List[LedgerEntryOut]
 
 
-def _ensure_sms_settings(db: Session, user_id: int) -> AccountSmsSettings:
-    row = (
-        db.query(AccountSmsSettings)
-        .filter(AccountSmsSettings.user_id == user_id)
-        .first()
-    )
+def _ensure_sms_settings(db: Session, user_id: int, *, commit: bool = True) -> AccountSmsSettings:
+    """
+    Fetch the user's SMS settings row, creating it on first use.
+    The create is an upsert on the unique user_id, so concurrent first
+    requests can't fail on each other. Write endpoints pass commit=False and
+    the new row lands with the endpoint's own final commit.
+    """
+    params = {"user_id": user_id}
+    row = db.execute(_SMS_SETTINGS_BY_USER, params).scalars().first()
     if row:
         return row
-    row = AccountSmsSettings(
+    stmt = mysql_insert(AccountSmsSettings).values(
         user_id=user_id,
         chasing_delivery_mode="email",
     )
-    db.add(row)
-    db.commit()
-    db.refresh(row)
-    return row
+    db.execute(stmt.on_duplicate_key_update(user_id=stmt.inserted.user_id))
+    if commit:
+        db.commit()
+    return db.execute(_SMS_SETTINGS_BY_USER, params).scalar_one()
 
 def _calculate_credit_balance(db: Session, user_id: int) -> tuple[bool, int]:
-    has_entries = (
-        db.query(SmsCreditLedger.id)
-        .filter(SmsCreditLedger.user_id == user_id)
-        .first()
-        is not None
-    )
-    if not has_entries:
-        return False, 0
-
-    total = (
+    # Full ledger SUM; only used for drift checks now that
+    # AccountSmsSettings.credits_balance is kept as the running balance.
+    # one round-trip: the row count tells us whether a ledger exists at all
+    entry_count, total = (
         db.query(
+            func.count(SmsCreditLedger.id),
             func.coalesce(
                 func.sum(
                     case(
@@ -105,37 +124,29 @@ def _calculate_credit_balance(db: Session, user_id: int) -> tuple[bool, int]:
                     )
                 ),
                 0,
-            )
+            ),
         )
         .filter(SmsCreditLedger.user_id == user_id)
-        .scalar()
+        .one()
     )
+    if not entry_count:
+        return False, 0
     return True, int(total or 0)
 
-def _ensure_pricing(db: Session) -> SmsPricingSettings:
-    row = db.query(SmsPricingSettings).order_by(SmsPricingSettings.id.asc()).first()
-    if row:
-        return row
-    row = SmsPricingSettings(
-        sms_starting_credits=1000,
-        sms_monthly_number_cost=100,
-        sms_send_cost=5,
-        sms_forward_cost=5,
-        sms_suspend_after_days=14,
+def _sms_settings_to_out(row: AccountSmsSettings) -> SmsSettingsOut:
+    # values come straight from our own row, so skip field validation
+    return SmsSettingsOut.construct(
+        enabled=bool(row.enabled),
+        twilio_phone_number=row.twilio_phone_number,
+        twilio_phone_sid=row.twilio_phone_sid,
+        forwarding_enabled=bool(row.forwarding_enabled),
+        forward_to_phone=row.forward_to_phone,
+        bundle_size=row.bundle_size or 1000,
+        credits_balance=row.credits_balance or 0,
+        free_credits=row.free_credits or 0,
+        terms_accepted_at=row.terms_accepted_at,
+        terms_version=row.terms_version,
     )
-    db.add(row)
-    db.commit()
-    db.refresh(row)
-    return row
-
-def _build_pricing_snapshot(row: SmsPricingSettings) -> dict:
-    return {
-        "sms_starting_credits": row.sms_starting_credits,
-        "sms_monthly_number_cost": row.sms_monthly_number_cost,
-        "sms_send_cost": row.sms_send_cost,
-        "sms_forward_cost": row.sms_forward_cost,
-        "sms_suspend_after_days": row.sms_suspend_after_days,
-    }
 
 def _twilio_auth_headers(username: str, password: str) -> tuple[str, str]:
     return (username, password)
@@ -152,8 +163,8 @@ def _twilio_credentials() -> tuple[str, str, str, str]:
 def _fetch_subaccount_auth_token(subaccount_sid: str, master_sid: str, master_auth_token: str) -> Optional[str]:
     if not master_auth_token:
         return None
-    subaccount_url = f"https://api.twilio.com/2010-04-01/Accounts/{subaccount_sid}.json"
-    r_sub = requests.get(
+    subaccount_url = f"{_TWILIO_API}/Accounts/{subaccount_sid}.json"
+    r_sub = twilio_http.get(
         subaccount_url,
         auth=_twilio_auth_headers(master_sid, master_auth_token),
         timeout=20,
@@ -175,7 +186,7 @@ def _twilio_request_with_fallback(
     data: Optional[dict] = None,
     timeout: int = 20,
 ):
-    response = requests.request(
+    response = twilio_http.request(
         method,
         url,
         params=params,
@@ -184,7 +195,7 @@ def _twilio_request_with_fallback(
         timeout=timeout,
     )
     if response.status_code == 401 and fallback_auth and fallback_auth != primary_auth:
-        response = requests.request(
+        response = twilio_http.request(
             method,
             url,
             params=params,
@@ -204,7 +215,7 @@ def _find_active_subaccount_by_name(
     master_sid: str,
     master_auth_token: str,
 ) -> Optional[str]:
-    list_url = "https://api.twilio.com/2010-04-01/Accounts.json"
+    list_url = f"{_TWILIO_API}/Accounts.json"
     params = {
         "FriendlyName": friendly_name,
         "Status": "active",
@@ -238,7 +249,7 @@ def _is_subaccount_active(
 ) -> bool:
     if not account_sid:
         return False
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}.json"
+    url = f"{_TWILIO_API}/Accounts/{account_sid}.json"
     primary_auth = _subaccount_primary_auth(master_sid, master_auth_token, api_key_sid, api_key_secret)
     fallback_auth = _twilio_auth_headers(master_sid, master_auth_token) if master_auth_token else None
     r_account = _twilio_request_with_fallback(
@@ -261,7 +272,7 @@ def _find_existing_bundle_sid(
     master_sid: str,
     master_auth_token: str,
 ) -> Optional[str]:
-    bundle_url = "https://numbers.twilio.com/v2/RegulatoryCompliance/Bundles"
+    bundle_url = _TWILIO_BUNDLES_URL
     params = {
         "AccountSid": account_sid,
         "FriendlyName": friendly_name,
@@ -297,9 +308,9 @@ def _configure_incoming_number(
     master_sid: str,
     master_auth_token: str,
 ) -> dict:
-    inbound_url = f"{webhook_base.rstrip('/')}/api/sms/webhooks/inbound"
-    status_url = f"{webhook_base.rstrip('/')}/api/sms/webhooks/status"
-    update_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/IncomingPhoneNumbers/{phone_sid}.json"
+    inbound_url = f"{webhook_base}{_INBOUND_WEBHOOK_PATH}"
+    status_url = f"{webhook_base}{_STATUS_WEBHOOK_PATH}"
+    update_url = f"{_TWILIO_API}/Accounts/{account_sid}/IncomingPhoneNumbers/{phone_sid}.json"
     update_payload = {
         "SmsUrl": inbound_url,
         "SmsMethod": "POST",
@@ -334,7 +345,7 @@ def _find_existing_phone_number(
     master_sid: str,
     master_auth_token: str,
 ) -> Optional[dict]:
-    list_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/IncomingPhoneNumbers.json"
+    list_url = f"{_TWILIO_API}/Accounts/{account_sid}/IncomingPhoneNumbers.json"
     params = {"PageSize": 20}
     primary_auth = _subaccount_primary_auth(master_sid, master_auth_token, api_key_sid, api_key_secret)
     fallback_auth = _twilio_auth_headers(master_sid, master_auth_token) if master_auth_token else None
@@ -376,13 +387,13 @@ def _clone_twilio_bundle(
     api_key_secret: str,
     friendly_name: str,
 ) -> str:
-    clone_url = f"https://numbers.twilio.com/v2/RegulatoryCompliance/Bundles/{parent_bundle_sid}/Clones"
+    clone_url = f"{_TWILIO_BUNDLES_URL}/{parent_bundle_sid}/Clones"
     clone_payload = {
         "TargetAccountSid": target_account_sid,
         "FriendlyName": friendly_name,
         "MoveToDraft": "false",
     }
-    r_clone = requests.post(
+    r_clone = twilio_http.post(
         clone_url,
         data=clone_payload,
         auth=_twilio_auth_headers(api_key_sid, api_key_secret),
@@ -411,7 +422,7 @@ def _provision_twilio_number(
     master_auth_token: str,
 ) -> dict:
     available_url = (
-        f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/AvailablePhoneNumbers/"
+        f"{_TWILIO_API}/Accounts/{account_sid}/AvailablePhoneNumbers/"
         f"{country}/Mobile.json"
     )
     available_params = {
@@ -441,9 +452,9 @@ def _provision_twilio_number(
     if not phone_number:
         raise HTTPException(status_code=502, detail="Twilio did not return a phone number.")
 
-    inbound_url = f"{webhook_base.rstrip('/')}/api/sms/webhooks/inbound"
-    status_url = f"{webhook_base.rstrip('/')}/api/sms/webhooks/status"
-    purchase_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/IncomingPhoneNumbers.json"
+    inbound_url = f"{webhook_base}{_INBOUND_WEBHOOK_PATH}"
+    status_url = f"{webhook_base}{_STATUS_WEBHOOK_PATH}"
+    purchase_url = f"{_TWILIO_API}/Accounts/{account_sid}/IncomingPhoneNumbers.json"
     purchase_payload = {
         "PhoneNumber": phone_number,
         "SmsUrl": inbound_url,
@@ -477,6 +488,7 @@ def _ensure_twilio_subaccount(
     existing_bundle_sid: Optional[str] = None,
     existing_phone_sid: Optional[str] = None,
     existing_phone_number: Optional[str] = None,
+    has_auth_token: bool = False,
 ) -> dict:
     master_sid, api_key_sid, api_key_secret, master_auth_token = _twilio_credentials()
     if not parent_bundle_sid:
@@ -499,9 +511,9 @@ def _ensure_twilio_subaccount(
         ) or ""
 
     if not sub_sid:
-        create_url = "https://api.twilio.com/2010-04-01/Accounts.json"
+        create_url = f"{_TWILIO_API}/Accounts.json"
         payload = {"FriendlyName": friendly_name}
-        r_create = requests.post(
+        r_create = twilio_http.post(
             create_url,
             data=payload,
             auth=_twilio_auth_headers(api_key_sid, api_key_secret),
@@ -514,65 +526,83 @@ def _ensure_twilio_subaccount(
         if not sub_sid:
             raise HTTPException(status_code=502, detail="Twilio did not return a subaccount SID.")
 
-    if not sub_token:
-        sub_token = _fetch_subaccount_auth_token(sub_sid, master_sid, master_auth_token)
-
-    bundle_sid = (existing_bundle_sid or "").strip()
-    if not bundle_sid:
-        bundle_sid = _find_existing_bundle_sid(
-            account_sid=sub_sid,
-            friendly_name=bundle_friendly_name,
-            api_key_sid=api_key_sid,
-            api_key_secret=api_key_secret,
-            master_sid=master_sid,
-            master_auth_token=master_auth_token,
-        ) or ""
-
-    if not bundle_sid:
-        bundle_sid = _clone_twilio_bundle(
-            parent_bundle_sid=parent_bundle_sid,
-            target_account_sid=sub_sid,
-            api_key_sid=api_key_sid,
-            api_key_secret=api_key_secret,
-            friendly_name=bundle_friendly_name,
-        )
-
-    provisioned: dict = {}
-    has_existing_phone = bool((existing_phone_sid or "").strip() and (existing_phone_number or "").strip())
-    if has_existing_phone:
-        provisioned = _configure_incoming_number(
-            account_sid=sub_sid,
-            phone_sid=(existing_phone_sid or "").strip(),
-            webhook_base=webhook_base,
-            api_key_sid=api_key_sid,
-            api_key_secret=api_key_secret,
-            bundle_sid=bundle_sid,
-            master_sid=master_sid,
-            master_auth_token=master_auth_token,
-        )
-        provisioned["phone_number"] = provisioned.get("phone_number") or (existing_phone_number or "").strip()
-    else:
-        provisioned = _find_existing_phone_number(
-            account_sid=sub_sid,
-            webhook_base=webhook_base,
-            api_key_sid=api_key_sid,
-            api_key_secret=api_key_secret,
-            bundle_sid=bundle_sid,
-            master_sid=master_sid,
-            master_auth_token=master_auth_token,
-        ) or {}
+    # The auth-token lookup doesn't feed the bundle/number steps below, so
+    # run it alongside them instead of paying its round-trip up front.
+    # A token we already store for this same subaccount is still valid, so
+    # skip the lookup (and the re-encryption in enable_sms) in that case.
+    token_future = None
+    keep_stored_token = has_auth_token and sub_sid == (existing_subaccount_sid or "").strip()
+    if not sub_token and not keep_stored_token:
+        token_future = _TOKEN_LOOKUPS.submit(_fetch_subaccount_auth_token, sub_sid, master_sid, master_auth_token)
+
+    try:
+        bundle_sid = (existing_bundle_sid or "").strip()
+        if not bundle_sid:
+            bundle_sid = _find_existing_bundle_sid(
+                account_sid=sub_sid,
+                friendly_name=bundle_friendly_name,
+                api_key_sid=api_key_sid,
+                api_key_secret=api_key_secret,
+                master_sid=master_sid,
+                master_auth_token=master_auth_token,
+            ) or ""
+
+        if not bundle_sid:
+            bundle_sid = _clone_twilio_bundle(
+                parent_bundle_sid=parent_bundle_sid,
+                target_account_sid=sub_sid,
+                api_key_sid=api_key_sid,
+                api_key_secret=api_key_secret,
+                friendly_name=bundle_friendly_name,
+            )
 
-    if not provisioned.get("phone_sid"):
-        provisioned = _provision_twilio_number(
-            country=country,
-            webhook_base=webhook_base,
-            account_sid=sub_sid,
-            auth_sid=api_key_sid,
-            auth_secret=api_key_secret,
-            bundle_sid=bundle_sid,
-            master_sid=master_sid,
-            master_auth_token=master_auth_token,
-        )
+        provisioned: dict = {}
+        has_existing_phone = bool((existing_phone_sid or "").strip() and (existing_phone_number or "").strip())
+        if has_existing_phone:
+            provisioned = _configure_incoming_number(
+                account_sid=sub_sid,
+                phone_sid=(existing_phone_sid or "").strip(),
+                webhook_base=webhook_base,
+                api_key_sid=api_key_sid,
+                api_key_secret=api_key_secret,
+                bundle_sid=bundle_sid,
+                master_sid=master_sid,
+                master_auth_token=master_auth_token,
+            )
+            provisioned["phone_number"] = provisioned.get("phone_number") or (existing_phone_number or "").strip()
+        else:
+            provisioned = _find_existing_phone_number(
+                account_sid=sub_sid,
+                webhook_base=webhook_base,
+                api_key_sid=api_key_sid,
+                api_key_secret=api_key_secret,
+                bundle_sid=bundle_sid,
+                master_sid=master_sid,
+                master_auth_token=master_auth_token,
+            ) or {}
+
+        if not provisioned.get("phone_sid"):
+            provisioned = _provision_twilio_number(
+                country=country,
+                webhook_base=webhook_base,
+                account_sid=sub_sid,
+                auth_sid=api_key_sid,
+                auth_secret=api_key_secret,
+                bundle_sid=bundle_sid,
+                master_sid=master_sid,
+                master_auth_token=master_auth_token,
+            )
+    except BaseException:
+        # provisioning failed: don't leave a queued lookup behind
+        if token_future is not None:
+            token_future.cancel()
+        raise
+
+    if token_future is not None:
+        try:
+            sub_token = token_future.result()
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Twilio subaccount auth token lookup failed: {e}")
 
     return {
         "subaccount_sid": sub_sid,
@@ -587,8 +617,7 @@ def get_pricing(
     db: Session = Depends(get_db),
     user=Depends(require_user),
 ):
-    row = _ensure_pricing(db)
-    return PricingOut(**_build_pricing_snapshot(row))
+    return PricingOut.construct(**get_pricing_snapshot(db))
 
 
 @router.get("/ledger", response_model=LedgerOut)
@@ -601,8 +630,7 @@ def get_sms_ledger(
     limit = max(1, min(200, int(limit or 50)))
     offset = max(0, int(offset or 0))
     row = _ensure_sms_settings(db, user.id)
-    has_ledger, ledger_balance = _calculate_credit_balance(db, user.id)
-    balance = ledger_balance if has_ledger else (row.credits_balance or 0)
+    balance = row.credits_balance or 0
 
     entries = (
         db.query(SmsCreditLedger)
@@ -635,27 +663,34 @@ def get_sms_ledger(
 
     return LedgerOut(balance=balance, entries=items)
 
+@router.get("/ledger/reconcile")
+def reconcile_sms_ledger(
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    owner=Depends(require_owner),
+):
+    """Owner-only drift check: stored running balance vs a full ledger SUM."""
+    uid = user_id or owner.id
+    stored = (
+        db.query(AccountSmsSettings.credits_balance)
+        .filter(AccountSmsSettings.user_id == uid)
+        .scalar()
+    ) or 0
+    _, ledger_balance = _calculate_credit_balance(db, uid)
+    return {
+        "user_id": uid,
+        "balance": stored,
+        "ledger_balance": ledger_balance,
+        "drift": stored - ledger_balance,
+    }
+
 @router.get("/settings", response_model=SmsSettingsOut)
 def get_sms_settings(
     db: Session = Depends(get_db),
     user = Depends(require_user),
 ):
     row = _ensure_sms_settings(db, user.id)
-    has_ledger, ledger_balance = _calculate_credit_balance(db, user.id)
-    credits_balance = ledger_balance if has_ledger else (row.credits_balance or 0)
-
-    return SmsSettingsOut(
-        enabled=bool(row.enabled),
-        twilio_phone_number=row.twilio_phone_number,
-        twilio_phone_sid=row.twilio_phone_sid,
-        forwarding_enabled=bool(row.forwarding_enabled),
-        forward_to_phone=row.forward_to_phone,
-        bundle_size=row.bundle_size or 1000,
-        credits_balance=credits_balance,
-        free_credits=row.free_credits or 0,
-        terms_accepted_at=row.terms_accepted_at,
-        terms_version=row.terms_version,
-    )
+    return _sms_settings_to_out(row)
 
 @router.post("/enable", response_model=SmsSettingsOut)
 def enable_sms(
@@ -667,21 +702,31 @@ def enable_sms(
     if not payload.accepted:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Terms acceptance required")
 
-    row = _ensure_sms_settings(db, user.id)
+    row = _ensure_sms_settings(db, user.id, commit=False)
     first_enable = row.terms_accepted_at is None
-    pricing = _ensure_pricing(db)
-    snapshot = payload.pricing_snapshot or _build_pricing_snapshot(pricing)
-    webhook_base = (os.getenv("TWILIO_WEBHOOK_BASE_URL", "") or "").strip()
+    pricing = get_pricing_snapshot(db)
+    snapshot = payload.pricing_snapshot or pricing
+    terms_version = (payload.terms_version or "v1")[:32]
+
+    # repeat /enable for an already provisioned account on the same terms:
+    # nothing to provision or record, so answer without touching Twilio or writing
+    if (
+        row.enabled
+        and row.twilio_subaccount_sid
+        and row.twilio_bundle_sid
+        and row.twilio_phone_sid
+        and row.twilio_phone_number
+        and row.terms_version == terms_version
+        and row.accepted_pricing_snapshot == snapshot
+    ):
+        return _sms_settings_to_out(row)
+
+    # normalised once here; the Twilio helpers append paths to it as-is
+    webhook_base = (os.getenv("TWILIO_WEBHOOK_BASE_URL", "") or "").strip().rstrip("/")
     country = (payload.country or os.getenv("TWILIO_DEFAULT_COUNTRY", "GB") or "GB").upper()
     if not webhook_base:
         raise HTTPException(status_code=400, detail="TWILIO_WEBHOOK_BASE_URL is not configured.")
 
-    row.enabled = True
-    row.terms_accepted_at = datetime.utcnow()
-    row.terms_version = (payload.terms_version or "v1")[:32]
-    row.terms_accepted_ip = request.client.host if request.client else None
-    row.accepted_pricing_snapshot = snapshot
-
     parent_bundle_sid = (os.getenv("TWILIO_PARENT_BUNDLE_SID", "") or "").strip()
 
     needs_subaccount = not row.twilio_subaccount_sid
@@ -689,16 +734,23 @@ def enable_sms(
     needs_phone = not row.twilio_phone_sid or not row.twilio_phone_number
 
     if needs_subaccount or needs_bundle or needs_phone:
-        provisioned = _ensure_twilio_subaccount(
+        has_phone = bool(row.twilio_phone_sid and row.twilio_phone_number)
+        provision_args = dict(
             user_email=user.email or "",
             webhook_base=webhook_base,
             country=country,
             parent_bundle_sid=parent_bundle_sid,
             existing_subaccount_sid=row.twilio_subaccount_sid,
             existing_bundle_sid=row.twilio_bundle_sid,
-            existing_phone_sid=row.twilio_phone_sid if row.twilio_phone_sid and row.twilio_phone_number else None,
-            existing_phone_number=row.twilio_phone_number if row.twilio_phone_sid and row.twilio_phone_number else None,
+            existing_phone_sid=row.twilio_phone_sid if has_phone else None,
+            existing_phone_number=row.twilio_phone_number if has_phone else None,
+            has_auth_token=bool(row.twilio_auth_token_enc),
         )
+        # End the transaction (persisting a just-created settings row) and
+        # hand the connection back to the pool for the slow Twilio round
+        # trips; `row` reloads on first access afterwards.
+        db.commit()
+        provisioned = _ensure_twilio_subaccount(**provision_args)
         if needs_subaccount:
             row.twilio_subaccount_sid = provisioned["subaccount_sid"]
         if provisioned.get("auth_token"):
@@ -711,29 +763,31 @@ def enable_sms(
             if not row.twilio_phone_sid or not row.twilio_phone_number:
                 raise HTTPException(status_code=502, detail="Twilio did not return a provisioned phone number.")
 
+    row.enabled = True
+    row.terms_accepted_at = datetime.utcnow()
+    row.terms_version = terms_version
+    row.terms_accepted_ip = request.client.host if request.client else None
+    row.accepted_pricing_snapshot = snapshot
+
     if first_enable and row.credits_balance == 0 and row.free_credits == 0:
-        row.credits_balance = pricing.sms_starting_credits
-        row.free_credits = pricing.sms_starting_credits
+        starting = int(pricing["sms_starting_credits"] or 0)
+        row.free_credits = starting
+        if starting > 0:
+            add_ledger_entry(
+                db,
+                SmsCreditLedger(
+                    user_id=row.user_id,
+                    entry_type="credit",
+                    amount=starting,
+                    reason="starting_credits",
+                ),
+            )
+            db.expire(row, ["credits_balance"])
 
-    db.add(row)
+    # build the response from the in-memory row before commit expires it
+    out = _sms_settings_to_out(row)
     db.commit()
-    db.refresh(row)
-
-    has_ledger, ledger_balance = _calculate_credit_balance(db, user.id)
-    credits_balance = ledger_balance if has_ledger else (row.credits_balance or 0)
-
-    return SmsSettingsOut(
-        enabled=bool(row.enabled),
-        twilio_phone_number=row.twilio_phone_number,
-        twilio_phone_sid=row.twilio_phone_sid,
-        forwarding_enabled=bool(row.forwarding_enabled),
-        forward_to_phone=row.forward_to_phone,
-        bundle_size=row.bundle_size or 1000,
-        credits_balance=credits_balance,
-        free_credits=row.free_credits or 0,
-        terms_accepted_at=row.terms_accepted_at,
-        terms_version=row.terms_version,
-    )
+    return out
 
 @router.post("/settings", response_model=SmsSettingsOut)
 def update_sms_settings(
@@ -741,48 +795,41 @@ def update_sms_settings(
     db: Session = Depends(get_db),
     user = Depends(require_user),
 ):
-    row = _ensure_sms_settings(db, user.id)
+    row = _ensure_sms_settings(db, user.id, commit=False)
+    updates: dict = {}
 
     if payload.enabled is not None:
-        row.enabled = bool(payload.enabled)
+        updates["enabled"] = bool(payload.enabled)
 
     if payload.forwarding_enabled is not None:
-        row.forwarding_enabled = bool(payload.forwarding_enabled)
+        updates["forwarding_enabled"] = bool(payload.forwarding_enabled)
 
     if payload.forward_to_phone is not None:
-        row.forward_to_phone = payload.forward_to_phone.strip() or None
+        updates["forward_to_phone"] = payload.forward_to_phone.strip() or None
 
     if payload.bundle_size is not None:
-        row.bundle_size = int(payload.bundle_size)
-
-    if payload.credits_balance is not None:
-        row.credits_balance = int(payload.credits_balance)
+        updates["bundle_size"] = int(payload.bundle_size)
 
     if payload.free_credits is not None:
-        row.free_credits = int(payload.free_credits)
+        updates["free_credits"] = int(payload.free_credits)
 
     if payload.twilio_phone_number is not None:
-        row.twilio_phone_number = payload.twilio_phone_number.strip() or None
+        updates["twilio_phone_number"] = payload.twilio_phone_number.strip() or None
 
     if payload.twilio_phone_sid is not None:
-        row.twilio_phone_sid = payload.twilio_phone_sid.strip() or None
+        updates["twilio_phone_sid"] = payload.twilio_phone_sid.strip() or None
+
+    # one UPDATE with only the columns that actually change (none -> no write);
+    # the default synchronize_session keeps `row` in step for the response
+    updates = {k: v for k, v in updates.items() if getattr(row, k) != v}
+    if updates:
+        db.execute(
+            update(AccountSmsSettings)
+            .where(AccountSmsSettings.id == row.id)
+            .values(**updates)
+        )
 
-    db.add(row)
+    # build the response from the in-memory row before commit expires it
+    out = _sms_settings_to_out(row)
     db.commit()
-    db.refresh(row)
-
-    has_ledger, ledger_balance = _calculate_credit_balance(db, user.id)
-    credits_balance = ledger_balance if has_ledger else (row.credits_balance or 0)
-
-    return SmsSettingsOut(
-        enabled=bool(row.enabled),
-        twilio_phone_number=row.twilio_phone_number,
-        twilio_phone_sid=row.twilio_phone_sid,
-        forwarding_enabled=bool(row.forwarding_enabled),
-        forward_to_phone=row.forward_to_phone,
-        bundle_size=row.bundle_size or 1000,
-        credits_balance=credits_balance,
-        free_credits=row.free_credits or 0,
-        terms_accepted_at=row.terms_accepted_at,
-        terms_version=row.terms_version,
-    )
+    return out
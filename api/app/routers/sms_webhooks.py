@@ -1,24 +1,78 @@
 # api/app/routers/sms_webhooks.py
 import base64
-import hashlib
 import hmac
 import os
+import secrets
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
+from urllib.parse import parse_qsl
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
-import requests
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from sqlalchemy import bindparam, func, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, raiseload
 
 from ..crypto_secrets import decrypt_secret
-from ..database import get_db
-from ..models import AccountSmsSettings, EmailOutbox, SmsCreditLedger, SmsPricingSettings, SmsWebhookLog
+from ..database import SessionLocal, get_db
+from ..models import AccountSmsSettings, EmailOutbox, SmsCreditLedger, SmsWebhookLog
+from ..services.sms_credits import add_ledger_entry
+from ..services.sms_pricing_logic import get_pricing_snapshot
+from ..services.twilio_http import twilio_http
 
 router = APIRouter(prefix="/api/sms/webhooks", tags=["sms-webhooks"])
 
-
-def _normalize_params(form: dict) -> dict:
-    return {k: v if not isinstance(v, list) else (v[0] if v else "") for k, v in form.items()}
+# read once at import (config/.env is loaded by ..database above)
+_VALIDATE_SIGNATURE = (os.getenv("TWILIO_VALIDATE_SIGNATURE", "") or "").strip().lower() in {"1", "true", "yes"}
+_LOG_WEBHOOKS = (os.getenv("TWILIO_LOG_WEBHOOKS", "") or "").strip().lower() in {"1", "true", "yes"}
+
+# per-process key for blinding signatures before comparison
+_SIGNATURE_BLIND_KEY = secrets.token_bytes(32)
+
+# hot-path statements built once; SQLAlchemy's compiled cache reuses their SQL
+_OUTBOX_BY_SID = select(EmailOutbox).where(EmailOutbox.provider_message_id == bindparam("sid"))
+_DEBIT_FOR_SID = (
+    SmsCreditLedger.user_id == bindparam("user_id"),
+    SmsCreditLedger.entry_type == "debit",
+    SmsCreditLedger.reference_id == bindparam("sid"),
+)
+_DEBIT_BY_SID = select(SmsCreditLedger).where(*_DEBIT_FOR_SID)
+_DEBIT_EXISTS = select(literal(1)).where(*_DEBIT_FOR_SID).limit(1)
+
+# GSM 03.38 alphabet; extension-table characters cost two septets
+_GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+_GSM7_EXTENDED = frozenset("^{}\\[~]|€\f")
+
+# message SID -> num_segments fetched from Twilio (cleared when full)
+_NUM_SEGMENTS_CACHE_MAX = 4096
+_num_segments_cache: dict = {}
+
+# Twilio MessageStatus -> outbox delivery_status
+_STATUS_MAP = {
+    "queued": "queued",
+    "sending": "sent",
+    "sent": "sent",
+    "delivered": "delivered",
+    "undelivered": "bounced",
+    "failed": "bounced",
+}
+
+# outbox column stamped the first time a message reaches each final status
+_STATUS_TIMESTAMP_COLUMN = {
+    "delivered": EmailOutbox.delivered_at,
+    "bounced": EmailOutbox.bounced_at,
+}
+
+
+def _parse_params(body: bytes) -> dict:
+    # Twilio always posts application/x-www-form-urlencoded; parse the raw
+    # body once (last value wins for repeated keys, as with request.form()).
+    # Malformed bytes are replaced rather than raising; such a body then
+    # fails the signature check instead of turning into a 500.
+    return dict(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
 
 
 def _twilio_auth_headers(username: str, password: str) -> tuple[str, str]:
@@ -26,84 +80,76 @@ def _twilio_auth_headers(username: str, password: str) -> tuple[str, str]:
 
 
 def _build_twilio_signature(url: str, params: dict, auth_token: str) -> str:
-    base = url
-    for key in sorted(params.keys()):
-        base += f"{key}{params[key]}"
-    digest = hmac.new(auth_token.encode("utf-8"), base.encode("utf-8"), hashlib.sha1).digest()
+    # one join instead of repeated +=, then OpenSSL's one-shot HMAC
+    message = url + "".join(f"{key}{params[key]}" for key in sorted(params))
+    digest = hmac.digest(auth_token.encode("utf-8"), message.encode("utf-8"), "sha1")
     return base64.b64encode(digest).decode("utf-8")
 
 
+@lru_cache(maxsize=1024)
+def _decrypt_auth_token(token_enc: str) -> str:
+    # keyed by ciphertext: a rotated token has a new ciphertext, so stale
+    # entries are never served, just eventually evicted
+    return decrypt_secret(token_enc)
+
+
 def _validate_twilio_signature(request: Request, params: dict, auth_token: str) -> None:
-    if (os.getenv("TWILIO_VALIDATE_SIGNATURE", "") or "").strip().lower() not in {"1", "true", "yes"}:
+    if not _VALIDATE_SIGNATURE:
         return
     signature = request.headers.get("X-Twilio-Signature")
     if not signature:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Twilio signature")
     expected = _build_twilio_signature(str(request.url), params, auth_token)
-    if not hmac.compare_digest(signature, expected):
+    # compare fixed-length MACs of both values: equal lengths for compare_digest,
+    # and a non-ASCII header can't make it raise
+    if not hmac.compare_digest(
+        hmac.digest(_SIGNATURE_BLIND_KEY, signature.encode("utf-8"), "sha256"),
+        hmac.digest(_SIGNATURE_BLIND_KEY, expected.encode("utf-8"), "sha256"),
+    ):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Twilio signature")
 
 
 def _lookup_sms_settings(db: Session, account_sid: Optional[str], to_number: Optional[str]) -> Optional[AccountSmsSettings]:
+    # one query for both keys; a subaccount match still wins over a number match
+    conditions = []
     if account_sid:
-        row = (
-            db.query(AccountSmsSettings)
-            .filter(AccountSmsSettings.twilio_subaccount_sid == account_sid)
-            .first()
-        )
-        if row:
-            return row
+        conditions.append(AccountSmsSettings.twilio_subaccount_sid == account_sid)
     if to_number:
-        return (
-            db.query(AccountSmsSettings)
-            .filter(AccountSmsSettings.twilio_phone_number == to_number)
-            .first()
-        )
-    return None
+        conditions.append(AccountSmsSettings.twilio_phone_number == to_number)
+    if not conditions:
+        return None
+    # no relationship is needed on the webhook path; fail loudly if one is touched
+    query = db.query(AccountSmsSettings).options(raiseload("*")).filter(or_(*conditions))
+    if len(conditions) > 1:
+        query = query.order_by(conditions[0].desc())
+    return query.first()
 
 
 def _update_outbox_status(db: Session, message_sid: str, status_value: str, payload: dict) -> int:
-    outbox = _lookup_outbox_by_sid(db, message_sid)
-    if not outbox:
-        return 0
+    # one UPDATE instead of load-then-flush; the first delivered/bounced
+    # timestamp is kept via COALESCE
     now = datetime.utcnow()
-    outbox.delivery_status = status_value
-    outbox.delivery_detail = payload
-    if status_value == "delivered" and not outbox.delivered_at:
-        outbox.delivered_at = now
-    if status_value == "bounced" and not outbox.bounced_at:
-        outbox.bounced_at = now
-    outbox.updated_at = now
-    db.add(outbox)
-    db.commit()
-    return 1
+    values = {
+        "delivery_status": status_value,
+        "delivery_detail": payload,
+        "updated_at": now,
+    }
+    ts_column = _STATUS_TIMESTAMP_COLUMN.get(status_value)
+    if ts_column is not None:
+        values[ts_column.key] = func.coalesce(ts_column, now)
+    result = db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.provider_message_id == message_sid)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
 
 
 def _lookup_outbox_by_sid(db: Session, message_sid: str) -> Optional[EmailOutbox]:
     if not message_sid:
         return None
-    return (
-        db.query(EmailOutbox)
-        .filter(EmailOutbox.provider_message_id == message_sid)
-        .first()
-    )
-
-
-def _ensure_pricing(db: Session) -> SmsPricingSettings:
-    row = db.query(SmsPricingSettings).order_by(SmsPricingSettings.id.asc()).first()
-    if row:
-        return row
-    row = SmsPricingSettings(
-        sms_starting_credits=1000,
-        sms_monthly_number_cost=100,
-        sms_send_cost=5,
-        sms_forward_cost=5,
-        sms_suspend_after_days=14,
-    )
-    db.add(row)
-    db.commit()
-    db.refresh(row)
-    return row
+    return db.execute(_OUTBOX_BY_SID, {"sid": message_sid}).scalars().first()
 
 
 def _twilio_fetch_message_details(account_sid: str, message_sid: str) -> dict:
@@ -122,49 +168,82 @@ def _twilio_fetch_message_details(account_sid: str, message_sid: str) -> dict:
         if master_sid and master_auth_token
         else None
     )
-    r = requests.get(url, auth=primary_auth, timeout=20)
+    r = twilio_http.get(url, auth=primary_auth, timeout=20)
     if r.status_code == 401 and fallback_auth:
-        r = requests.get(url, auth=fallback_auth, timeout=20)
+        r = twilio_http.get(url, auth=fallback_auth, timeout=20)
     if not r.ok:
         return {}
     return r.json() or {}
 
 
+def _estimate_segments(body: str) -> int:
+    """Segments Twilio splits `body` into: GSM-7 160/153 septets, else UCS-2 70/67 units."""
+    if all(ch in _GSM7_BASIC or ch in _GSM7_EXTENDED for ch in body):
+        units = len(body) + sum(1 for ch in body if ch in _GSM7_EXTENDED)
+        single, multi = 160, 153
+    else:
+        units = len(body.encode("utf-16-le")) // 2
+        single, multi = 70, 67
+    if units <= single:
+        return 1
+    return -(-units // multi)
+
+
+def _num_segments_value(params: dict, message_sid: str, outbox: Optional[EmailOutbox] = None):
+    """
+    NumSegments from the callback, else estimated from the body we queued,
+    else from the Twilio Messages API. Fetched values are remembered per SID,
+    so the 'sent' and 'delivered' callbacks cost at most one API round-trip.
+    """
+    value = params.get("NumSegments")
+    if value not in (None, ""):
+        return value
+    if outbox is not None and outbox.channel == "sms" and outbox.body:
+        return _estimate_segments(outbox.body)
+    value = _num_segments_cache.get(message_sid)
+    if value is not None:
+        return value
+    value = _twilio_fetch_message_details(
+        (params.get("AccountSid") or "").strip(),
+        message_sid,
+    ).get("num_segments")
+    if value not in (None, ""):
+        if len(_num_segments_cache) >= _NUM_SEGMENTS_CACHE_MAX:
+            _num_segments_cache.clear()
+        _num_segments_cache[message_sid] = value
+    return value
+
+
 def _record_sms_debit(
     db: Session,
-    settings: Optional[AccountSmsSettings],
+    settings_user_id: Optional[int],
     params: dict,
 ) -> None:
     message_sid = (params.get("MessageSid") or "").strip()
     if not message_sid:
         return
     outbox = _lookup_outbox_by_sid(db, message_sid)
-    if not settings and not outbox:
+    if not settings_user_id and not outbox:
         return
     status = (params.get("MessageStatus") or "").lower()
     if status not in {"sent", "delivered"}:
         return
-    existing = (
-        db.query(SmsCreditLedger)
-        .filter(
-            SmsCreditLedger.user_id == (settings.user_id if settings else outbox.user_id),
-            SmsCreditLedger.entry_type == "debit",
-            SmsCreditLedger.reference_id == message_sid,
-        )
-        .first()
-    )
+    user_id = settings_user_id or outbox.user_id
+    debit_key = {"user_id": user_id, "sid": message_sid}
+    # only 'delivered' touches an existing debit; 'sent' just needs to know it exists
+    if status == "sent":
+        if db.execute(_DEBIT_EXISTS, debit_key).first():
+            return
+        existing = None
+    else:
+        existing = db.execute(_DEBIT_BY_SID, debit_key).scalars().first()
     if existing:
         if status == "delivered":
-            details = existing.details or {}
+            # copy: mutating the loaded JSON dict in place isn't seen as a change
+            details = dict(existing.details or {})
             details["status"] = "delivered"
             if not details.get("segments") or details.get("segments") == 1:
-                num_segments_value = params.get("NumSegments")
-                if num_segments_value in (None, ""):
-                    msg_details = _twilio_fetch_message_details(
-                        (params.get("AccountSid") or "").strip(),
-                        message_sid,
-                    )
-                    num_segments_value = msg_details.get("num_segments")
+                num_segments_value = _num_segments_value(params, message_sid, outbox)
                 try:
                     segs = int(num_segments_value or details.get("segments") or 1)
                 except (TypeError, ValueError):
@@ -172,28 +251,20 @@ def _record_sms_debit(
                 details["segments"] = max(1, segs)
             existing.details = details
             db.add(existing)
-            db.commit()
         return
 
-    num_segments_value = params.get("NumSegments")
-    if num_segments_value in (None, ""):
-        details = _twilio_fetch_message_details(
-            (params.get("AccountSid") or "").strip(),
-            message_sid,
-        )
-        num_segments_value = details.get("num_segments")
+    num_segments_value = _num_segments_value(params, message_sid, outbox)
     try:
         num_segments = int(num_segments_value or 1)
     except (TypeError, ValueError):
         num_segments = 1
     num_segments = max(1, num_segments)
-    pricing = _ensure_pricing(db)
-    credits_per_segment = int(pricing.sms_send_cost or 0)
+    pricing = get_pricing_snapshot(db)
+    credits_per_segment = int(pricing["sms_send_cost"] or 0)
     total_credits = max(0, num_segments * credits_per_segment)
     if total_credits <= 0:
         return
 
-    user_id = settings.user_id if settings else outbox.user_id
     to_number = params.get("To") or (outbox.to_email if outbox else None)
     from_number = params.get("From")
     entry = SmsCreditLedger(
@@ -213,12 +284,17 @@ def _record_sms_debit(
             "customer_id": outbox.customer_id if outbox else None,
         },
     )
-    db.add(entry)
-    db.commit()
+    try:
+        with db.begin_nested():
+            add_ledger_entry(db, entry)
+    except IntegrityError:
+        # a concurrent callback for the same SID recorded the debit first;
+        # the savepoint also undid our balance bump
+        return
 
 
 def _log_sms_webhook(db: Session, kind: str, params: dict) -> None:
-    if (os.getenv("TWILIO_LOG_WEBHOOKS", "") or "").strip().lower() not in {"1", "true", "yes"}:
+    if not _LOG_WEBHOOKS:
         return
     record = SmsWebhookLog(
         kind=kind,
@@ -226,25 +302,51 @@ def _log_sms_webhook(db: Session, kind: str, params: dict) -> None:
         message_sid=(params.get("MessageSid") or "").strip() or None,
         payload=params,
     )
-    db.add(record)
-    db.commit()
+    db.add(record)  # committed with the rest of the callback's writes
     return None
 
 
+def _record_sms_debit_task(settings_user_id: Optional[int], params: dict) -> None:
+    """
+    BackgroundTasks entry point: bill the message after Twilio has had its
+    200, on a session of its own (the request session is closed by then).
+    """
+    db = SessionLocal()
+    try:
+        _record_sms_debit(db, settings_user_id, params)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        _log_sms_webhook(
+            db,
+            "status-error",
+            {"error": str(exc), "note": "ledger update failed", **params},
+        )
+        _commit_webhook_logs(db)
+    finally:
+        db.close()
+
+
+def _commit_webhook_logs(db: Session) -> None:
+    # on paths with no other writes, staged log rows are the only pending work
+    if db.new:
+        db.commit()
+
+
 @router.post("/inbound")
 async def inbound_sms(request: Request, db: Session = Depends(get_db)):
-    form = await request.form()
-    params = _normalize_params(dict(form))
+    params = _parse_params(await request.body())
     _log_sms_webhook(db, "inbound", params)
     account_sid = params.get("AccountSid")
     to_number = params.get("To")
 
     settings = _lookup_sms_settings(db, account_sid, to_number)
     if not settings:
+        _commit_webhook_logs(db)
         return {"ok": True, "reason": "unknown_number"}
 
-    if settings.twilio_auth_token_enc:
-        auth_token = decrypt_secret(settings.twilio_auth_token_enc)
+    if _VALIDATE_SIGNATURE and settings.twilio_auth_token_enc:
+        auth_token = _decrypt_auth_token(settings.twilio_auth_token_enc)
         try:
             _validate_twilio_signature(request, params, auth_token)
         except HTTPException as exc:
@@ -253,22 +355,27 @@ async def inbound_sms(request: Request, db: Session = Depends(get_db)):
                 "signature-error",
                 {"error": exc.detail, "kind": "inbound", **params},
             )
+            _commit_webhook_logs(db)
             raise
 
+    _commit_webhook_logs(db)
     return {"ok": True}
 
 
 @router.post("/status")
-async def sms_status(request: Request, db: Session = Depends(get_db)):
-    form = await request.form()
-    params = _normalize_params(dict(form))
+async def sms_status(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    params = _parse_params(await request.body())
     _log_sms_webhook(db, "status", params)
     account_sid = params.get("AccountSid")
     to_number = params.get("To")
 
     settings = _lookup_sms_settings(db, account_sid, to_number)
-    if settings and settings.twilio_auth_token_enc:
-        auth_token = decrypt_secret(settings.twilio_auth_token_enc)
+    if _VALIDATE_SIGNATURE and settings and settings.twilio_auth_token_enc:
+        auth_token = _decrypt_auth_token(settings.twilio_auth_token_enc)
         try:
             _validate_twilio_signature(request, params, auth_token)
         except HTTPException as exc:
@@ -277,29 +384,24 @@ async def sms_status(request: Request, db: Session = Depends(get_db)):
                 "signature-error",
                 {"error": exc.detail, "kind": "status", **params},
             )
+            _commit_webhook_logs(db)
             raise
 
     message_sid = params.get("MessageSid")
     message_status = (params.get("MessageStatus") or "").lower()
-    status_map = {
-        "queued": "queued",
-        "sending": "sent",
-        "sent": "sent",
-        "delivered": "delivered",
-        "undelivered": "bounced",
-        "failed": "bounced",
-    }
-    mapped_status = status_map.get(message_status, "queued")
+    mapped_status = _STATUS_MAP.get(message_status, "queued")
 
     if message_sid:
         try:
             updated = _update_outbox_status(db, message_sid, mapped_status, params)
         except Exception as exc:
+            db.rollback()
             _log_sms_webhook(
                 db,
                 "status-error",
                 {"error": str(exc), "note": "outbox update failed", **params},
             )
+            _commit_webhook_logs(db)
             return {"ok": False, "error": "outbox_update_failed"}
         if updated == 0:
             _log_sms_webhook(
@@ -307,14 +409,11 @@ async def sms_status(request: Request, db: Session = Depends(get_db)):
                 "status-unmatched",
                 {"note": "no outbox row updated", **params},
             )
-        try:
-            _record_sms_debit(db, settings, params)
-        except Exception as exc:
-            _log_sms_webhook(
-                db,
-                "status-error",
-                {"error": str(exc), "note": "ledger update failed", **params},
-            )
-            return {"ok": False, "error": "ledger_update_failed"}
+        settings_user_id = settings.user_id if settings else None
+        db.commit()
+        # billing may need a Twilio lookup; do it after acknowledging the callback
+        background_tasks.add_task(_record_sms_debit_task, settings_user_id, params)
+    else:
+        _commit_webhook_logs(db)
 
     return {"ok": True}
@@ -1,13 +1,14 @@
 # app/routers/statement_globals.py
 from __future__ import annotations
 
-import json
+from datetime import datetime
 from typing import Literal, Optional, List, Dict, Any
 
 from fastapi import Depends, HTTPException
 from pydantic import BaseModel
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from sqlalchemy.orm import Session
+import orjson
 
 from ..shared import APIRouter
 from ..database import get_db
@@ -50,7 +51,7 @@ def _json_first_int(val: Any, default: int) -> int:
         if val is None:
             return default
         if isinstance(val, str):
-            val = json.loads(val)
+            val = orjson.loads(val)
         if isinstance(val, (list, tuple)) and val:
             return int(val[0])
         return int(val)
@@ -64,59 +65,6 @@ def _hour_from_hhmm(s: Optional[str]) -> int:
     except Exception:
         return 14
 
-def _days_list_from_row(row: dict) -> list[int]:
-    """
-    Convert row's weekly/monthly day fields into the integer list the scheduler expects.
-    - weekly: reminder_weekdays is a SET of tokens ('mon',...), convert to [0..6]
-    - monthly: reminder_month_days is JSON array of ints
-    """
-    freq = row.get("reminder_frequency")
-    if freq == "weekly":
-        tokens = (row.get("reminder_weekdays") or "").split(",")
-        map_idx = {"mon":0,"tue":1,"wed":2,"thu":3,"fri":4,"sat":5,"sun":6}
-        out = [map_idx[t.strip().lower()] for t in tokens if t.strip().lower() in map_idx]
-        # we store only one for globals, but keep it generic
-        return out or [0]
-    else:
-        # monthly
-        try:
-            import json
-            arr = json.loads(row.get("reminder_month_days") or "[]")
-            return [int(x) for x in arr] or [1]
-        except Exception:
-            return [1]
-
-def _recompute_next_run_for_global(db: Session, user_id: int, freq: Freq) -> None:
-    """
-    Reads the (updated) global rule and writes reminder_next_run_utc based on:
-    - reminder_time (HH:MM)
-    - weekly: reminder_weekdays tokens -> [0..6]
-    - monthly: reminder_month_days JSON -> [1..31]
-    - user's timezone
-    """
-    row = db.execute(text("""
-        SELECT id, reminder_frequency, reminder_time, reminder_weekdays, reminder_month_days
-          FROM reminder_rules
-         WHERE user_id=:uid AND is_global=1 AND reminder_type='statements' AND reminder_frequency=:freq
-         LIMIT 1
-    """), {"uid": user_id, "freq": freq}).mappings().first()
-    if not row:
-        return
-
-    days_list = _days_list_from_row(dict(row))
-    tz = _get_user_tz(db, user_id)
-    hhmm = _norm_time(row["reminder_time"])
-    next_utc = _local_hhmm_next_utc(freq, hhmm, days_list, tz)
-
-    db.execute(text("""
-        UPDATE reminder_rules
-           SET reminder_next_run_utc = :nx
-         WHERE id = :rid
-         LIMIT 1
-    """), {"nx": next_utc, "rid": row["id"]})
-    db.commit()
-
-
 # -------------------- ensure two global rules --------------------
 
 # ------------------------ data accessors ------------------------
@@ -145,8 +93,9 @@ def update_global_rule(
     enabled: Optional[bool] = None,
     time_hhmm: Optional[str] = None,   # "HH:MM"
     day_value: Optional[int] = None,   # weekly: 0..6, monthly: 1..31
+    next_run_utc: Optional[datetime] = None,
 ) -> None:
-    ensure_global_rules(db, user_id)
+    ensure_global_rules(db, user_id, commit=False)
 
     sets: List[str] = []
     params: Dict[str, Any] = {"uid": user_id, "freq": frequency}
@@ -172,7 +121,12 @@ def update_global_rule(
             sets.append("reminder_weekdays = NULL")
             params["dom"] = dom
 
+    if next_run_utc is not None:
+        sets.append("reminder_next_run_utc = :nx")
+        params["nx"] = next_run_utc
+
     if not sets:
+        db.commit()  # still persist any rule ensure_global_rules just created
         return
 
     sql = f"""
@@ -188,18 +142,21 @@ def update_global_rule(
 
 # --------------------------- exclusions -------------------------
 
-def list_global_exclusions(db: Session, user_id: int, frequency: Freq) -> List[Dict[str, Any]]:
+def list_global_exclusions(db: Session, user_id: int, frequencies: List[Freq]) -> List[Dict[str, Any]]:
+    """Exclusions for the given frequencies in one query, grouped in the order listed."""
     rows = db.execute(
         text("""
-            SELECT e.customer_id, c.name AS customer_name, e.created_at
+            SELECT e.frequency, e.customer_id, c.name AS customer_name, e.created_at
               FROM reminder_global_exclusions e
               LEFT JOIN customers c ON c.id = e.customer_id
-             WHERE e.user_id=:uid AND e.frequency=:freq
+             WHERE e.user_id=:uid AND e.frequency IN :freqs
              ORDER BY c.name, e.customer_id
-        """),
-        {"uid": user_id, "freq": frequency},
+        """).bindparams(bindparam("freqs", expanding=True)),
+        {"uid": user_id, "freqs": list(frequencies)},
     ).mappings().all()
-    return [dict(r) for r in rows]
+    # stable sort: grouped by frequency, name order kept within each group
+    rank = {f: i for i, f in enumerate(frequencies)}
+    return sorted((dict(r) for r in rows), key=lambda r: rank[r["frequency"]])
 
 def add_global_exclusion(db: Session, user_id: int, frequency: Freq, customer_id: int) -> None:
     db.execute(
@@ -279,13 +236,16 @@ def update_weekly(
     user = Depends(require_user),
 ):
     hhmm = f"{max(0, min(23, int(body.hour))):02d}:00"
+    day = max(0, min(6, int(body.dow)))
+    # next run comes straight from the new values: one UPDATE, no re-read
+    next_utc = _local_hhmm_next_utc("weekly", hhmm, [day], _get_user_tz(db, user.id))
     update_global_rule(
         db, user.id, "weekly",
         enabled=bool(body.enabled),
         time_hhmm=hhmm,
-        day_value=max(0, min(6, int(body.dow))),
+        day_value=day,
+        next_run_utc=next_utc,
     )
-    _recompute_next_run_for_global(db, user.id, "weekly")
     return {"ok": True}
 
 @router.post("/monthly")
@@ -295,13 +255,16 @@ def update_monthly(
     user = Depends(require_user),
 ):
     hhmm = f"{max(0, min(23, int(body.hour))):02d}:00"
+    day = max(1, min(31, int(body.dom)))
+    # next run comes straight from the new values: one UPDATE, no re-read
+    next_utc = _local_hhmm_next_utc("monthly", hhmm, [day], _get_user_tz(db, user.id))
     update_global_rule(
         db, user.id, "monthly",
         enabled=bool(body.enabled),
         time_hhmm=hhmm,
-        day_value=max(1, min(31, int(body.dom))),
+        day_value=day,
+        next_run_utc=next_utc,
     )
-    _recompute_next_run_for_global(db, user.id, "monthly")
     return {"ok": True}
 
 @router.get("/exclusions")
@@ -309,12 +272,11 @@ def list_exclusions_route(
     db: Session = Depends(get_db),
     user = Depends(require_user),
 ):
-    weekly = list_global_exclusions(db, user.id, "weekly")
-    monthly = list_global_exclusions(db, user.id, "monthly")
-    return (
-        [{"customer_id": r["customer_id"], "customer_name": r.get("customer_name"), "frequency": "weekly"} for r in weekly]
-        + [{"customer_id": r["customer_id"], "customer_name": r.get("customer_name"), "frequency": "monthly"} for r in monthly]
-    )
+    rows = list_global_exclusions(db, user.id, ["weekly", "monthly"])
+    return [
+        {"customer_id": r["customer_id"], "customer_name": r.get("customer_name"), "frequency": r["frequency"]}
+        for r in rows
+    ]
 
 @router.post("/exclusions")
 def add_exclusion_route(
@@ -5,15 +5,16 @@ import logging, json
 log = logging.getLogger(__name__)
 from typing import Optional, List, Literal
 import traceback
+import orjson
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field, validator, EmailStr, constr
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
 from zoneinfo import ZoneInfo
-from fastapi.responses import PlainTextResponse
+from calendar import monthrange
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
-from sqlalchemy import func, distinct, literal
+from sqlalchemy import func, distinct, literal, select, update
 from sqlalchemy import text as sqltext
 
 from ..database import get_db
@@ -24,12 +25,11 @@ from ..models import (
     StatementRun,
     EmailOutbox,
     ReminderEvent,
-    User,
     AppSettings, 
 )
 from .auth import require_user
 
-router = APIRouter(prefix="/api/statement_reminders", tags=["statement_reminders"])
+router = APIRouter(prefix="/api/statement_reminders", tags=["statement_reminders"], default_response_class=ORJSONResponse)
 
 # -------------------- Pydantic (Statements) --------------------
 
@@ -88,18 +88,19 @@ class OneOffStatementIn(BaseModel):
 
 # -------------------- Helpers --------------------
 
-IDX2WD = {0:"mon",1:"tue",2:"wed",3:"thu",4:"fri",5:"sat",6:"sun"}
-WD2IDX = {v:k for k,v in IDX2WD.items()}
+_UTC = ZoneInfo("UTC")
+
+IDX2WD = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+WD2IDX = {v: k for k, v in enumerate(IDX2WD)}
 
 def idxs_to_set(indices: Optional[List[int]]) -> Optional[str]:
     if not indices: return None
-    parts = [IDX2WD[i] for i in indices if i in IDX2WD]
+    parts = [IDX2WD[i] for i in indices if 0 <= i < 7]
     return ",".join(parts) if parts else None
 
 def set_to_idxs(s: Optional[str]) -> Optional[List[int]]:
     if not s: return None
-    parts = [p.strip() for p in str(s).split(",") if p.strip()]
-    out = [WD2IDX[p] for p in parts if p in WD2IDX]
+    out = [i for i in (WD2IDX.get(p.strip(), -1) for p in str(s).split(",")) if i >= 0]
     return out or None
 
 def _parse_hhmm(s: str) -> dtime:
@@ -114,7 +115,7 @@ def _from_json_list(s: Optional[object]) -> Optional[List[int]]:
         return [int(x) for x in s if isinstance(x, (int, str)) and str(x).isdigit()]
     if isinstance(s, str):
         try:
-            v = json.loads(s)
+            v = orjson.loads(s)
             return v if isinstance(v, list) else None
         except Exception:
             return None
@@ -134,6 +135,17 @@ def _norm_time(v) -> str:
     return s[:5]
 
 
+def _hh_mm(v) -> tuple:
+    """(hour, minute) straight from 'HH:MM[:SS]', a time(), or a TIME timedelta."""
+    if hasattr(v, "hour"):
+        return v.hour, v.minute
+    if isinstance(v, timedelta):
+        secs = int(v.total_seconds())
+        return secs // 3600 % 24, secs // 60 % 60
+    hh, mm = str(v).split(":")[:2]
+    return int(hh), int(mm)
+
+
 def _iso_utc(dt: datetime | None) -> str | None:
     """Return RFC3339-style UTC string with trailing 'Z' (or None)."""
     if not dt:
@@ -145,23 +157,27 @@ def _iso_utc(dt: datetime | None) -> str | None:
         dt = dt.astimezone(timezone.utc)
     return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def _to_out_statement(rule: ReminderRule) -> StatementRuleOut:
-    days_out = (
-        set_to_idxs(rule.reminder_weekdays)
-        if rule.reminder_frequency == "weekly"
-        else _from_json_list(rule.reminder_month_days)
-    )
-    return StatementRuleOut(
+def _rule_days(rule) -> Optional[List[int]]:
+    """Decode the rule's schedule days once: weekday SET or month-day JSON."""
+    if rule.reminder_frequency == "weekly":
+        return set_to_idxs(rule.reminder_weekdays)
+    return _from_json_list(rule.reminder_month_days)
+
+def _to_out_statement(rule: ReminderRule, runs_count: int = 0, emails_count: int = 0) -> StatementRuleOut:
+    # values come from our own row / helpers, so skip field validation
+    return StatementRuleOut.construct(
         id=rule.id,
         name=rule.name,
         reminder_frequency=rule.reminder_frequency,   # weekly | monthly
         reminder_time=_norm_time(rule.reminder_time), # still 'HH:MM'
-        reminder_days=days_out,
+        reminder_days=_rule_days(rule),
         reminder_enabled=bool(rule.reminder_enabled),
         reminder_type="statement",
         reminder_next_run=_iso_utc(rule.reminder_next_run_utc),
         reminder_last_run=_iso_utc(rule.reminder_last_run_utc),
         created_at=_iso_utc(rule.created_at),
+        runs_count=int(runs_count or 0),
+        emails_count=int(emails_count or 0),
     )
 
 class PreviewOut(BaseModel):
@@ -170,77 +186,97 @@ class PreviewOut(BaseModel):
 
 # Helper to calculate runs and email count
 def _rules_with_counts(db: Session, user_id: int):
-    # runs per rule
-    runs_sq = (
-        db.query(
-            StatementRun.rule_id.label("rule_id"),
-            func.count(StatementRun.id).label("runs_count"),
-        )
-        .group_by(StatementRun.rule_id)
-        .subquery()
+    # correlated per-rule counts: each probes the rule_id index for just this
+    # user's rules instead of aggregating the whole runs/outbox tables
+    runs_count = (
+        select(func.count(StatementRun.id))
+        .where(StatementRun.rule_id == ReminderRule.id)
+        .correlate(ReminderRule)
+        .scalar_subquery()
     )
-
-    # emails per rule
-    emails_sq = (
-        db.query(
-            EmailOutbox.rule_id.label("rule_id"),
-            func.count(EmailOutbox.id).label("emails_count"),
-        )
-        .group_by(EmailOutbox.rule_id)
-        .subquery()
+    emails_count = (
+        select(func.count(EmailOutbox.id))
+        .where(EmailOutbox.rule_id == ReminderRule.id)
+        .correlate(ReminderRule)
+        .scalar_subquery()
     )
 
     return (
         db.query(
             ReminderRule,
-            func.coalesce(runs_sq.c.runs_count, literal(0)).label("runs_count"),
-            func.coalesce(emails_sq.c.emails_count, literal(0)).label("emails_count"),
+            runs_count.label("runs_count"),
+            emails_count.label("emails_count"),
         )
         .filter(
             ReminderRule.user_id == user_id,
             ReminderRule.reminder_type == "statements",
         )
-        .outerjoin(runs_sq, runs_sq.c.rule_id == ReminderRule.id)
-        .outerjoin(emails_sq, emails_sq.c.rule_id == ReminderRule.id)
         .order_by(ReminderRule.created_at.desc(), ReminderRule.id.desc())
     ).all()
 
 # ---------helper to filter out eligible customers for global statement rules---------
-
-def _eligible_customers_for_rule(db: Session, user_id: int, rule) -> list:
-    """
-    Returns customers eligible for this rule.
-    - For global rules, excludes any listed in reminder_global_exclusions for this frequency.
-    - Always requires a non-empty email.
-    TODO (optional): add "has open invoices" or other eligibility filters here.
-    """
-    params = {"uid": user_id}
+# Eligible customers for a rule (shared by the count and the INSERT ... SELECT):
+# - For global rules, excludes any listed in reminder_global_exclusions for this frequency.
+# - Always requires a non-empty email.
+# TODO (optional): add "has open invoices" or other eligibility filters here.
+
+_ELIGIBLE_FROM = """
+      FROM customers c
+     WHERE c.user_id = :uid
+       AND c.email IS NOT NULL
+       AND TRIM(c.email) <> ''
+"""
+
+_ELIGIBLE_FROM_GLOBAL = """
+      FROM customers c
+ LEFT JOIN reminder_global_exclusions e
+        ON e.user_id = :uid
+       AND e.frequency = :freq
+       AND e.customer_id = c.id
+     WHERE c.user_id = :uid
+       AND e.customer_id IS NULL
+       AND c.email IS NOT NULL
+       AND TRIM(c.email) <> ''
+"""
+
+# One statement job per eligible customer, built entirely server-side.
+# uq_outbox_run_customer turns a re-run of the same run into a no-op per
+# customer; every other error (FK, NOT NULL, truncation) still raises.
+# With FOUND_ROWS (SQLAlchemy's MySQL default) the rowcount counts those
+# no-op rows as 1, so it is the number of jobs the run has.
+_ENQUEUE_JOBS_SELECT = """
+    INSERT INTO email_outbox
+      (user_id, customer_id, channel, template, to_email, subject, body,
+       payload_json, rule_id, run_id, status, next_attempt_at,
+       provider, delivery_status, attempt_count, created_at, updated_at)
+    SELECT :uid, c.id, 'email', 'statement', c.email,
+           CONCAT('Statement for ', c.name), :body,
+           JSON_OBJECT('statement_url', CONCAT('/customers/', c.id, '/statement'),
+                       'customer_id', c.id, 'rule_id', :rid, 'run_id', :run_id),
+           :rid, :run_id, 'queued', :now,
+           'postmark', 'queued', 0, :now, :now
+"""
+
+_SQL_COUNT_ELIGIBLE = sqltext("SELECT COUNT(*)" + _ELIGIBLE_FROM)
+_SQL_COUNT_ELIGIBLE_GLOBAL = sqltext("SELECT COUNT(*)" + _ELIGIBLE_FROM_GLOBAL)
+_ON_DUPLICATE_JOB = "    ON DUPLICATE KEY UPDATE id = id\n"
+_SQL_ENQUEUE_JOBS = sqltext(_ENQUEUE_JOBS_SELECT + _ELIGIBLE_FROM + _ON_DUPLICATE_JOB)
+_SQL_ENQUEUE_JOBS_GLOBAL = sqltext(_ENQUEUE_JOBS_SELECT + _ELIGIBLE_FROM_GLOBAL + _ON_DUPLICATE_JOB)
+
+def _enqueue_statement_jobs(db: Session, rule, run_id: int, now: datetime) -> tuple:
+    """Queue a statement email per eligible customer; returns (eligible, enqueued)."""
+    params = {"uid": rule.user_id}
     if getattr(rule, "is_global", 0):
         params["freq"] = rule.reminder_frequency
-        sql = sqltext("""
-            SELECT c.id, c.name, c.email
-              FROM customers c
-         LEFT JOIN reminder_global_exclusions e
-                ON e.user_id = :uid
-               AND e.frequency = :freq
-               AND e.customer_id = c.id
-             WHERE c.user_id = :uid
-               AND e.customer_id IS NULL
-               AND c.email IS NOT NULL
-               AND TRIM(c.email) <> ''
-        """)
+        count_sql, insert_sql = _SQL_COUNT_ELIGIBLE_GLOBAL, _SQL_ENQUEUE_JOBS_GLOBAL
     else:
-        sql = sqltext("""
-            SELECT c.id, c.name, c.email
-              FROM customers c
-             WHERE c.user_id = :uid
-               AND c.email IS NOT NULL
-               AND TRIM(c.email) <> ''
-        """)
+        count_sql, insert_sql = _SQL_COUNT_ELIGIBLE, _SQL_ENQUEUE_JOBS
 
-    rows = db.execute(sql, params).fetchall()
-    # Return as simple objects/dicts to match later usage
-    return [{"id": r.id, "name": r.name, "email": r.email} for r in rows]
+    total = int(db.execute(count_sql, params).scalar() or 0)
+    if not total:
+        return 0, 0
+    params.update(rid=rule.id, run_id=run_id, body=_statement_body(), now=now)
+    return total, db.execute(insert_sql, params).rowcount
 
 
 # --- Timezone helpers ---------------------------------------------------------
@@ -252,36 +288,41 @@ def _get_user_tz(db: Session, user_id: int) -> ZoneInfo:
     try:
         return ZoneInfo(tz_name)
     except Exception:
-        return ZoneInfo("UTC")
+        return _UTC
 
-def _local_hhmm_next_utc(freq: str, hhmm: str, days: Optional[List[int]], tz: ZoneInfo) -> datetime:
+def _local_hhmm_next_utc(freq: str, hhmm, days: Optional[List[int]], tz: ZoneInfo) -> datetime:
     """
     Compute the next run (local to user's tz) then return it as *naive UTC*,
     which is what reminder_next_run_utc stores.
+    `hhmm` may be 'HH:MM' or the raw reminder_time column value.
     """
     now_tz = datetime.now(tz)
 
-    hh, mm = map(int, hhmm.split(":"))
+    hh, mm = _hh_mm(hhmm)
     today_local = now_tz.replace(hour=hh, minute=mm, second=0, microsecond=0)
 
     def to_utc_naive(dt_local: datetime) -> datetime:
-        return dt_local.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
+        return dt_local.astimezone(_UTC).replace(tzinfo=None)
 
     if freq == "weekly":
         if not days:
             cand = today_local if today_local > now_tz else (today_local + timedelta(days=1))
             return to_utc_naive(cand)
-        for offset in range(0, 8):
-            d = now_tz + timedelta(days=offset)
-            if d.weekday() in days:
-                cand = d.replace(hour=hh, minute=mm, second=0, microsecond=0)
-                if cand > now_tz:
-                    return to_utc_naive(cand)
+        # weekday search on plain ints (bit i = weekday i); only the winning
+        # candidate becomes a datetime
+        mask = 0
+        for i in days:
+            if 0 <= i <= 6:
+                mask |= 1 << i
+        wd = now_tz.weekday()
+        start = 0 if today_local > now_tz else 1
+        for offset in range(start, 8):
+            if mask >> ((wd + offset) % 7) & 1:
+                return to_utc_naive(today_local + timedelta(days=offset))
         cand = today_local + timedelta(days=1)
         return to_utc_naive(cand)
 
     if freq == "monthly":
-        from calendar import monthrange
         want = (days or [1])[0]
 
         def build(y, m, d):
@@ -299,18 +340,14 @@ def _local_hhmm_next_utc(freq: str, hhmm: str, days: Optional[List[int]], tz: Zo
 
 
 # -------------------- Statements CRUD --------------------
+# Handlers return ready-built models, so the schema is documented via
+# `responses=` instead of `response_model=` (which would validate them again).
 
-@router.get("/statements", response_model=List[StatementRuleOut])
+@router.get("/statements", responses={200: {"model": List[StatementRuleOut]}})
 def list_statement_rules(db: Session = Depends(get_db), user=Depends(require_user)):
     try:
         rows = _rules_with_counts(db, user.id)
-        out: List[StatementRuleOut] = []
-        for rule, runs_cnt, emails_cnt in rows:
-            dto = _to_out_statement(rule)
-            dto.runs_count = int(runs_cnt or 0)
-            dto.emails_count = int(emails_cnt or 0)
-            out.append(dto)
-        return out
+        return [_to_out_statement(rule, runs_cnt, emails_cnt) for rule, runs_cnt, emails_cnt in rows]
     except Exception:
         tb = traceback.format_exc()
         log.error("list_statement_rules failed:\n%s", tb)
@@ -318,7 +355,7 @@ def list_statement_rules(db: Session = Depends(get_db), user=Depends(require_use
         return PlainTextResponse(tb, status_code=500)
 
 
-@router.post("/statements", response_model=StatementRuleOut)
+@router.post("/statements", responses={200: {"model": StatementRuleOut}})
 def create_statement_rule(payload: StatementRuleIn, db: Session = Depends(get_db), user=Depends(require_user)):
     if payload.reminder_frequency not in ("weekly", "monthly"):
         raise HTTPException(400, "Statements can only be scheduled weekly or monthly.")
@@ -334,7 +371,7 @@ def create_statement_rule(payload: StatementRuleIn, db: Session = Depends(get_db
         reminder_time=payload.reminder_time,
         reminder_timezone=None,
         reminder_weekdays=idxs_to_set(payload.reminder_days) if payload.reminder_frequency == "weekly" else None,
-        reminder_month_days=json.dumps(payload.reminder_days) if (payload.reminder_frequency == "monthly" and payload.reminder_days) else None,
+        reminder_month_days=orjson.dumps(payload.reminder_days).decode() if (payload.reminder_frequency == "monthly" and payload.reminder_days) else None,
         reminder_invoice_filter="all",                  # statements always 'all'
         reminder_enabled=payload.reminder_enabled,
         reminder_next_run_utc=next_run,
@@ -347,7 +384,7 @@ def create_statement_rule(payload: StatementRuleIn, db: Session = Depends(get_db
     db.refresh(r)
     return _to_out_statement(r)
 
-@router.patch("/statements/{rule_id}", response_model=StatementRuleOut)
+@router.patch("/statements/{rule_id}", responses={200: {"model": StatementRuleOut}})
 def update_statement_rule(rule_id: int, payload: StatementRuleIn, db: Session = Depends(get_db), user=Depends(require_user)):
     r = (
         db.query(ReminderRule)
@@ -373,7 +410,7 @@ def update_statement_rule(rule_id: int, payload: StatementRuleIn, db: Session =
         r.reminder_weekdays = idxs_to_set(payload.reminder_days)
         r.reminder_month_days = None
     else:
-        r.reminder_month_days = json.dumps(payload.reminder_days) if payload.reminder_days else None
+        r.reminder_month_days = orjson.dumps(payload.reminder_days).decode() if payload.reminder_days else None
         r.reminder_weekdays = None
 
     # compute next run from user's timezone, store as UTC (naive)
@@ -385,8 +422,11 @@ def update_statement_rule(rule_id: int, payload: StatementRuleIn, db: Session =
         tz,
     )
 
-    r.schedule = r.schedule or ""
-    r.escalate = 0 if r.escalate is None else r.escalate
+    # NOT NULL in table: only backfill, so unchanged values stay out of the UPDATE
+    if r.schedule is None:
+        r.schedule = ""
+    if r.escalate is None:
+        r.escalate = 0
 
     db.commit()
     db.refresh(r)
@@ -395,15 +435,13 @@ def update_statement_rule(rule_id: int, payload: StatementRuleIn, db: Session =
 
 @router.delete("/statements/{rule_id}")
 def delete_statement_rule(rule_id: int, db: Session = Depends(get_db), user=Depends(require_user)):
-    # Check counts first
+    # Check for history first: one EXISTS probe per table (a joined COUNT
+    # would multiply runs by outbox rows)
     row = (
         db.query(
-            func.count(StatementRun.id),
-            func.count(EmailOutbox.id),
+            select(StatementRun.id).where(StatementRun.rule_id == ReminderRule.id).exists(),
+            select(EmailOutbox.id).where(EmailOutbox.rule_id == ReminderRule.id).exists(),
         )
-        .select_from(ReminderRule)
-        .outerjoin(StatementRun, StatementRun.rule_id == ReminderRule.id)
-        .outerjoin(EmailOutbox, EmailOutbox.rule_id == ReminderRule.id)
         .filter(ReminderRule.id == rule_id,
                 ReminderRule.user_id == user.id,
                 ReminderRule.reminder_type == "statements")
@@ -412,8 +450,8 @@ def delete_statement_rule(rule_id: int, db: Session = Depends(get_db), user=Depe
     if not row:
         raise HTTPException(404, "Rule not found")
 
-    runs_cnt, emails_cnt = (int(row[0] or 0), int(row[1] or 0))
-    if runs_cnt > 0 or emails_cnt > 0:
+    has_runs, has_emails = row
+    if has_runs or has_emails:
         # refuse hard delete if there is activity
         raise HTTPException(
             status_code=409,
@@ -434,7 +472,7 @@ def delete_statement_rule(rule_id: int, db: Session = Depends(get_db), user=Depe
     return {"ok": True}
 
 
-@router.get("/statements/{rule_id}/preview", response_model=PreviewOut)
+@router.get("/statements/{rule_id}/preview", responses={200: {"model": PreviewOut}})
 def preview_statement_rule(rule_id: int, days: int = 14, db: Session = Depends(get_db), user=Depends(require_user)):
     r = (
         db.query(ReminderRule)
@@ -444,11 +482,11 @@ def preview_statement_rule(rule_id: int, days: int = 14, db: Session = Depends(g
     if not r:
         raise HTTPException(404, "Rule not found")
 
-    days_list = set_to_idxs(r.reminder_weekdays) if r.reminder_frequency == "weekly" else _from_json_list(r.reminder_month_days)
+    days_list = _rule_days(r)
 
     runs: List[str] = []
     tz = _get_user_tz(db, user.id)
-    cur = r.reminder_next_run_utc or _local_hhmm_next_utc(r.reminder_frequency, _norm_time(r.reminder_time), days_list, tz)
+    cur = r.reminder_next_run_utc or _local_hhmm_next_utc(r.reminder_frequency, r.reminder_time, days_list, tz)
 
     end = datetime.utcnow() + timedelta(days=max(1, min(days, 90)))
 
@@ -462,7 +500,6 @@ def preview_statement_rule(rule_id: int, days: int = 14, db: Session = Depends(g
                     return cur
             return cur
         # monthly
-        from calendar import monthrange
         want = (days_list or [1])[0]
         y, m = (cur.year, cur.month + 1) if cur.month < 12 else (cur.year + 1, 1)
         dmax = monthrange(y, m)[1]
@@ -473,7 +510,7 @@ def preview_statement_rule(rule_id: int, days: int = 14, db: Session = Depends(g
         runs.append(cur.isoformat())
         cur = step_once(cur)
 
-    return PreviewOut(rule_id=r.id, next_runs=runs)
+    return PreviewOut.construct(rule_id=r.id, next_runs=runs)
 
 # -------------------- Enqueue-due (scalable, idempotent) --------------------
 
@@ -487,9 +524,6 @@ def _customers_with_email(db: Session, user_id: int):
           .all()
     )
 
-def _statement_subject(customer_name: str):
-    return f"Statement for {customer_name}"
-
 def _statement_body(default_message: str = None):
     return (default_message or "Please find your latest statement below.\n\nRegards,\nAccounts")
 
@@ -550,8 +584,18 @@ def enqueue_one_statement(body: OneOffStatementIn, db: Session = Depends(get_db)
 def enqueue_due_statement_runs(db: Session = Depends(get_db)):
     try:
         now = datetime.utcnow()
+        # only the columns the tick reads; next/last run are written back in bulk
         rules = (
-            db.query(ReminderRule)
+            db.query(
+                ReminderRule.id,
+                ReminderRule.user_id,
+                ReminderRule.is_global,
+                ReminderRule.reminder_frequency,
+                ReminderRule.reminder_time,
+                ReminderRule.reminder_weekdays,
+                ReminderRule.reminder_month_days,
+                ReminderRule.reminder_next_run_utc,
+            )
               .filter(
                   ReminderRule.reminder_type == "statements",
                   ReminderRule.reminder_enabled == True,                     # noqa: E712
@@ -559,29 +603,30 @@ def enqueue_due_statement_runs(db: Session = Depends(get_db)):
                   ReminderRule.reminder_next_run_utc <= now,
               )
               .order_by(ReminderRule.reminder_next_run_utc.asc())
-              # .with_for_update(skip_locked=True)
+              # lock the due rules until the commit below; a concurrent tick
+              # skips them instead of enqueueing the same run twice
+              .with_for_update(skip_locked=True)
               .all()
         )
 
         processed = []
+        advanced = []
+        tz_by_user: dict = {}   # one AppSettings lookup per user per tick
         for rule in rules:
-            user = db.query(User).filter(User.id == rule.user_id).first()
-            if not user:
-                continue
-
+            # reminder_rules.user_id is a NOT NULL FK to users, no need to load the user
             run = StatementRun(
                 rule_id=rule.id,
-                user_id=user.id,
+                user_id=rule.user_id,
                 run_scheduled_at=rule.reminder_next_run_utc,
                 status="queued",
                 created_at=now,
             )
             try:
+                # a duplicate run only undoes this savepoint, not earlier rules
                 with db.begin_nested():
                     db.add(run)
                     db.flush()
             except Exception:
-                db.rollback()
                 run = (db.query(StatementRun)
                          .filter(StatementRun.rule_id == rule.id,
                                  StatementRun.run_scheduled_at == rule.reminder_next_run_utc)
@@ -590,53 +635,29 @@ def enqueue_due_statement_runs(db: Session = Depends(get_db)):
                     raise
 
             # ⬇️ use the new helper (applies global exclusions if is_global=1)
-            customers = _eligible_customers_for_rule(db, user_id=user.id, rule=rule)
-            run.total_customers = len(customers)
-
-            jobs = 0
-            for c in customers:
-                job = EmailOutbox(
-                    user_id=user.id,
-                    customer_id=c["id"],
-                    channel="email",
-                    template="statement",
-                    to_email=c["email"],
-                    subject=_statement_subject(c["name"]),
-                    body=_statement_body(),
-                    payload_json={
-                        "statement_url": f"/customers/{c['id']}/statement",
-                        "customer_id": c["id"],
-                        "rule_id": rule.id,
-                        "run_id": run.id,
-                    },
-                    rule_id=rule.id,
-                    run_id=run.id,
-                    status="queued",
-                    next_attempt_at=now,
-                )
-                try:
-                    with db.begin_nested():
-                        db.add(job)
-                        db.flush()
-                    jobs += 1
-                except IntegrityError:
-                    db.rollback()
-
+            run.total_customers, jobs = _enqueue_statement_jobs(db, rule, run.id, now)
             run.jobs_enqueued = jobs
             processed.append({"rule_id": rule.id, "run_id": run.id, "jobs": jobs})
 
             # advance next_run (unchanged)
-            days_list = (set_to_idxs(rule.reminder_weekdays)
-                         if rule.reminder_frequency == "weekly"
-                         else _from_json_list(rule.reminder_month_days))
-            tz = _get_user_tz(db, rule.user_id)
-            rule.reminder_last_run_utc = now
-            rule.reminder_next_run_utc = _local_hhmm_next_utc(
-                rule.reminder_frequency,
-                _norm_time(rule.reminder_time),
-                days_list,
-                tz,
-            )
+            days_list = _rule_days(rule)
+            tz = tz_by_user.get(rule.user_id)
+            if tz is None:
+                tz = tz_by_user[rule.user_id] = _get_user_tz(db, rule.user_id)
+            advanced.append({
+                "id": rule.id,
+                "reminder_last_run_utc": now,
+                "reminder_next_run_utc": _local_hhmm_next_utc(
+                    rule.reminder_frequency,
+                    rule.reminder_time,
+                    days_list,
+                    tz,
+                ),
+            })
+
+        if advanced:
+            # ORM bulk UPDATE by primary key: one executemany for every rule
+            db.execute(update(ReminderRule), advanced)
 
         db.commit()
         return {"ok": True, "runs": processed}
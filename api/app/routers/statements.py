@@ -1,18 +1,19 @@
 # api/app/routers/statements.py
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
 from typing import List, Optional, Dict
 
-from sqlalchemy import func, and_, case
+from sqlalchemy import func, and_, case, literal, null, select, union_all
 from ..shared import APIRouter, Depends, HTTPException, BaseModel, Session
 from ..database import get_db
-from fastapi.responses import Response
-from ..services.statement_pdf import render_statement_pdf_html, render_pdf_from_html
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from ..services.statement_pdf import render_statement_pdf_html_for_customer, render_pdf_from_html, html_cache_key
 from ..services.statements_logic import compute_statement_summary
 from ..models import Customer, Invoice, Payment, PaymentAllocation
 from ..schemas.statements import StatementOut
 from .auth import require_user   # <-- enforce auth + ownership
 
-router = APIRouter(prefix="/api/statements", tags=["statements"]) 
+router = APIRouter(prefix="/api/statements", tags=["statements"], default_response_class=ORJSONResponse)
 
 # ----------------------------
 # Ledger (back-compat) models
@@ -33,7 +34,9 @@ class RowOut(BaseModel):
 # (1) LEDGER ENDPOINT — back compatible with existing frontend
 #     GET /api/statements/customer/{id}
 # -------------------------------------------------------------
-@router.get("/customer/{customer_id}", response_model=List[RowOut])
+# rows are built with construct() from our own query, so document the schema
+# via `responses=` rather than have response_model validate every row again
+@router.get("/customer/{customer_id}", responses={200: {"model": List[RowOut]}})
 def customer_ledger(
     customer_id: int,
     date_from: Optional[str] = None,  # 'YYYY-MM-DD'
@@ -53,95 +56,100 @@ def customer_ledger(
     df: Optional[date] = datetime.fromisoformat(date_from).date() if date_from else None
     dt_: Optional[date] = datetime.fromisoformat(date_to).date() if date_to else None
 
+    # half-open range on the raw timestamp (no DATE() wrapper) so the
+    # (customer_id, issue_date / received_at) indexes can be used
     def within(col):
         conds = []
-        if df:  conds.append(col >= df)
-        if dt_: conds.append(col <= dt_)
+        if df:  conds.append(col >= datetime.combine(df, time.min))
+        if dt_: conds.append(col < datetime.combine(dt_ + timedelta(days=1), time.min))
         return and_(*conds) if conds else True
 
-    rows: list[RowOut] = []
-
+    # One UNION ALL of the three credit/debit sources, sorted server-side.
     # 1) Invoices (debits) — scoped to this customer (and thus this user)
     inv_q = (
-        db.query(Invoice.id, Invoice.invoice_number, Invoice.issue_date, Invoice.amount_due)
-        .filter(Invoice.customer_id == customer_id)
-        .filter(Invoice.kind == "invoice")
-        .filter(within(func.date(Invoice.issue_date)))
-        .order_by(Invoice.issue_date.asc(), Invoice.id.asc())
+        select(
+            func.date(Invoice.issue_date).label("dt"),
+            literal("invoice").label("kind"),
+            null().label("subkind"),
+            func.concat("INV ", Invoice.invoice_number).label("ref"),
+            func.concat("Invoice ", Invoice.invoice_number).label("desc"),
+            Invoice.amount_due.label("debit"),
+            literal(0).label("credit"),
+            Invoice.issue_date.label("ts"),
+            Invoice.id.label("tiebreak"),
+        )
+        .where(Invoice.customer_id == customer_id)
+        .where(Invoice.kind == "invoice")
+        .where(within(Invoice.issue_date))
     )
-    for i in inv_q.all():
-        rows.append(RowOut(
-            dt=i.issue_date.date().isoformat(),
-            kind="invoice",
-            subkind=None,
-            ref=f"INV {i.invoice_number}",
-            desc=f"Invoice {i.invoice_number}",
-            debit=float(i.amount_due or 0),
-            credit=0.0,
-        ))
 
     # 2) Allocated payments (credits applied to invoices for this customer)
     alloc_q = (
-        db.query(
-            PaymentAllocation.payment_id,
-            PaymentAllocation.invoice_id,
-            PaymentAllocation.amount,
-            Payment.received_at,
-            Invoice.invoice_number,
+        select(
+            func.date(Payment.received_at).label("dt"),
+            literal("payment").label("kind"),
+            literal("alloc").label("subkind"),
+            func.concat("PAY ", PaymentAllocation.payment_id).label("ref"),
+            func.concat("Payment → Inv ", Invoice.invoice_number).label("desc"),
+            literal(0).label("debit"),
+            PaymentAllocation.amount.label("credit"),
+            Payment.received_at.label("ts"),
+            PaymentAllocation.id.label("tiebreak"),
         )
         .join(Payment, Payment.id == PaymentAllocation.payment_id)
         .join(Invoice, Invoice.id == PaymentAllocation.invoice_id)
-        .filter(Invoice.customer_id == customer_id)
-        .filter(within(func.date(Payment.received_at)))
-        .order_by(Payment.received_at.asc(), PaymentAllocation.id.asc())
+        .where(Invoice.customer_id == customer_id)
+        .where(within(Payment.received_at))
     )
-    for a in alloc_q.all():
-        rows.append(RowOut(
-            dt=a.received_at.date().isoformat(),
-            kind="payment",
-            subkind="alloc",
-            ref=f"PAY {a.payment_id}",
-            desc=f"Payment → Inv {a.invoice_number}",
-            debit=0.0,
-            credit=float(a.amount or 0),
-        ))
 
     # 3) Unallocated payment leftovers for this customer (still credits)
     sub = (
-        db.query(
+        select(
             PaymentAllocation.payment_id,
             func.coalesce(func.sum(PaymentAllocation.amount), 0).label("alloc")
         )
         .group_by(PaymentAllocation.payment_id)
         .subquery()
     )
+    unalloc = Payment.amount - func.coalesce(sub.c.alloc, 0)
     pay_q = (
-        db.query(
-            Payment.id,
-            Payment.received_at,
-            Payment.amount,
-            (Payment.amount - func.coalesce(sub.c.alloc, 0)).label("unalloc"),
+        select(
+            func.date(Payment.received_at).label("dt"),
+            literal("payment").label("kind"),
+            literal("unalloc").label("subkind"),
+            func.concat("PAY ", Payment.id).label("ref"),
+            literal("Unallocated payment").label("desc"),
+            literal(0).label("debit"),
+            unalloc.label("credit"),
+            Payment.received_at.label("ts"),
+            Payment.id.label("tiebreak"),
         )
         .outerjoin(sub, sub.c.payment_id == Payment.id)
-        .filter(Payment.customer_id == customer_id)
-        .filter(within(func.date(Payment.received_at)))
-        .order_by(Payment.received_at.asc(), Payment.id.asc())
+        .where(Payment.customer_id == customer_id)
+        .where(within(Payment.received_at))
+        .where(unalloc > 0)
+    )
+
+    ledger = union_all(inv_q, alloc_q, pay_q).subquery()
+    result = db.execute(
+        select(ledger).order_by(
+            # subkind/ts/tiebreak keep the old per-source order for equal (dt, kind, ref)
+            ledger.c.dt, ledger.c.kind, ledger.c.ref,
+            ledger.c.subkind, ledger.c.ts, ledger.c.tiebreak,
+        )
     )
-    for p in pay_q.all():
-        un = float(p.unalloc or 0)
-        if un > 0:
-            rows.append(RowOut(
-                dt=p.received_at.date().isoformat(),
-                kind="payment",
-                subkind="unalloc",
-                ref=f"PAY {p.id}",
-                desc="Unallocated payment",
-                debit=0.0,
-                credit=un,
-            ))
-
-    rows.sort(key=lambda r: (r.dt, r.kind, r.ref))
-    return rows
+    return [
+        RowOut.construct(
+            dt=r.dt.isoformat(),
+            kind=r.kind,
+            subkind=r.subkind,
+            ref=r.ref,
+            desc=r.desc,
+            debit=float(r.debit or 0),
+            credit=float(r.credit or 0),
+        )
+        for r in result
+    ]
 
 # -------------------------------------------------------------------
 # (2) SUMMARY ENDPOINT — richer open/buckets/unallocated view
@@ -172,12 +180,13 @@ def customer_statement_summary(
 @router.get("/customer/{customer_id}/pdf")
 def customer_statement_pdf(
     customer_id: int,
+    request: Request,
     date_to: Optional[str] = None,
     include_after_payments: Optional[bool] = False,
     db: Session = Depends(get_db),
     user = Depends(require_user),
 ):
-    html = render_statement_pdf_html(
+    html, cust = render_statement_pdf_html_for_customer(
         db=db,
         user_id=user.id,
         customer_id=customer_id,
@@ -187,15 +196,24 @@ def customer_statement_pdf(
     if not html:
         raise HTTPException(404, "Unable to render statement HTML")
 
-    pdf = render_pdf_from_html(html)
+    # The HTML carries every input of the PDF, so its hash is a strong ETag:
+    # a client that already has this exact statement gets a 304, no render.
+    key = html_cache_key(html)
+    etag = f'"{key}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match") or ""
+    if etag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=cache_headers)
+
+    pdf = render_pdf_from_html(html, cache_key=key)
     if not pdf:
         raise HTTPException(500, "Failed to render PDF")
 
-    cust = db.query(Customer).filter(Customer.id == customer_id, Customer.user_id == user.id).first()
-    cname = (cust.name if cust else f"Customer-{customer_id}")
+    # the render already loaded (and ownership-checked) the customer
+    cname = cust.name or f"Customer-{customer_id}"
     safe = "".join(ch if ch.isalnum() or ch in ("_", "-", " ") else "_" for ch in cname).strip().replace(" ", "_")
     suffix = f"-{date_to}" if date_to else ""
     filename = f"Statement-{safe}{suffix}.pdf"
 
-    headers = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+    headers = {"Content-Disposition": f"attachment; filename=\"{filename}\"", **cache_headers}
     return Response(content=pdf, media_type="application/pdf", headers=headers)
@@ -1,23 +1,24 @@
 # api/app/security.py
 import os
-from passlib.context import CryptContext
+import bcrypt
 
-# Match the stored hashes: bcrypt $2b$
-pwd_ctx = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto",
-    bcrypt__ident="2b",  # ensure $2b$ prefix
-    # bcrypt__rounds=12,  # defaults to 12; uncomment to force
-)
+# Match the stored hashes: bcrypt $2b$, cost 12 (what passlib produced).
+# Calls the bcrypt library directly instead of going through passlib's
+# CryptContext dispatch; $2a$/$2y$ hashes still verify.
+BCRYPT_ROUNDS = 12
+
+def _pw_bytes(plain: str) -> bytes:
+    # bcrypt only uses the first 72 bytes; passlib truncated silently too
+    return (plain or "").encode("utf-8")[:72]
 
 def hash_password(plain: str) -> str:
-    return pwd_ctx.hash(plain or "")
+    return bcrypt.hashpw(_pw_bytes(plain), bcrypt.gensalt(rounds=BCRYPT_ROUNDS, prefix=b"2b")).decode("ascii")
 
 def verify_password(plain: str, hashed: str) -> bool:
     if not hashed:
         return False
     try:
-        return pwd_ctx.verify(plain or "", hashed)
+        return bcrypt.checkpw(_pw_bytes(plain), hashed.encode("ascii"))
     except Exception:
         return False
 
@@ -0,0 +1,25 @@
+# app/services/sms_credits.py
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..models import AccountSmsSettings, SmsCreditLedger
+
+
+def add_ledger_entry(db: Session, entry: SmsCreditLedger) -> None:
+    """
+    Stage a ledger row and move AccountSmsSettings.credits_balance by the
+    same amount, so the stored balance always equals the ledger total and
+    reads never have to SUM the ledger. The caller commits.
+
+    The balance is bumped in SQL (credits_balance = credits_balance + delta)
+    so concurrent webhooks can't lose updates; callers holding the settings
+    row should db.expire(row, ["credits_balance"]) before reading it.
+    """
+    delta = entry.amount if entry.entry_type == "credit" else -entry.amount
+    db.add(entry)
+    db.execute(
+        update(AccountSmsSettings)
+        .where(AccountSmsSettings.user_id == entry.user_id)
+        .values(credits_balance=AccountSmsSettings.credits_balance + delta)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,60 @@
+# app/services/sms_pricing_logic.py
+import time
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from ..models import SmsPricingSettings
+
+DEFAULT_PRICING = {
+    "sms_starting_credits": 1000,
+    "sms_monthly_number_cost": 100,
+    "sms_send_cost": 5,
+    "sms_forward_cost": 5,
+    "sms_suspend_after_days": 14,
+}
+
+# pricing is a single admin-edited row; keep a short-lived per-process copy
+_PRICING_TTL_SECONDS = 60
+_pricing_cache: dict = {"snapshot": None, "expires": 0.0}
+
+
+def ensure_pricing(db: Session) -> SmsPricingSettings:
+    """
+    Return the pricing row, creating it with DEFAULT_PRICING on first use.
+    Concurrent first calls all insert id=1 and the duplicate-key no-op lets
+    exactly one of them win, instead of the losers failing on commit.
+    """
+    row = db.query(SmsPricingSettings).order_by(SmsPricingSettings.id.asc()).first()
+    if row:
+        return row
+    stmt = mysql_insert(SmsPricingSettings).values(id=1, **DEFAULT_PRICING)
+    db.execute(stmt.on_duplicate_key_update(id=stmt.inserted.id))
+    db.commit()
+    return db.query(SmsPricingSettings).order_by(SmsPricingSettings.id.asc()).first()
+
+
+def build_pricing_snapshot(row: SmsPricingSettings) -> dict:
+    return {
+        "sms_starting_credits": row.sms_starting_credits,
+        "sms_monthly_number_cost": row.sms_monthly_number_cost,
+        "sms_send_cost": row.sms_send_cost,
+        "sms_forward_cost": row.sms_forward_cost,
+        "sms_suspend_after_days": row.sms_suspend_after_days,
+    }
+
+
+def get_pricing_snapshot(db: Session) -> dict:
+    """Pricing as a plain dict, served from the per-process cache when fresh."""
+    now = time.monotonic()
+    snapshot = _pricing_cache["snapshot"]
+    if snapshot is None or now >= _pricing_cache["expires"]:
+        snapshot = build_pricing_snapshot(ensure_pricing(db))
+        _pricing_cache["snapshot"] = snapshot
+        _pricing_cache["expires"] = now + _PRICING_TTL_SECONDS
+    return dict(snapshot)
+
+
+def invalidate_pricing_cache() -> None:
+    _pricing_cache["snapshot"] = None
+    _pricing_cache["expires"] = 0.0
@@ -2,10 +2,11 @@
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-def ensure_global_rules(db: Session, user_id: int) -> None:
+def ensure_global_rules(db: Session, user_id: int, *, commit: bool = True) -> None:
     """
     Create the two global 'statements' rules (weekly + monthly) if missing.
     Matches the SQL you already had in the router.
+    Pass commit=False when the caller commits its own writes right after.
     """
     # WEEKLY
     db.execute(text("""
@@ -47,4 +48,5 @@ def ensure_global_rules(db: Session, user_id: int) -> None:
         )
     """), {"uid": user_id})
 
-    db.commit()
+    if commit:
+        db.commit()
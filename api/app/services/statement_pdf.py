@@ -1,12 +1,17 @@
 # app/services/statement_pdf.py
-from typing import Optional
+from typing import Optional, Tuple
 from pathlib import Path
+from functools import lru_cache
 import os
 from base64 import b64encode
+from hashlib import sha256
 import logging
+import tempfile
+import time
 
 from sqlalchemy.orm import Session
 import requests
+from requests.adapters import HTTPAdapter
 
 from ..models import AppSettings, Customer
 from ..shared import templates
@@ -14,86 +19,113 @@ from .statements_logic import compute_statement_summary
 
 log = logging.getLogger("statement_pdf")
 
+# Rendered PDFs keyed by a hash of their HTML (which already embeds the
+# statement data, branding and logo), so a repeat download skips wkhtmltopdf.
+_PDF_CACHE_DIR = Path(os.getenv("STATEMENT_PDF_CACHE_DIR") or Path(tempfile.gettempdir()) / "statement_pdf_cache")
+_PDF_CACHE_MAX_BYTES = int(os.getenv("STATEMENT_PDF_CACHE_MAX_MB", "200")) * 1024 * 1024
 
-def render_statement_pdf_html(
+_STATEMENT_TPL = templates.env.get_template("pdf/statement_pdf.html")
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+_LOGO_MIME = {
+    "jpg": "image/jpeg", "jpeg": "image/jpeg",
+    "png": "image/png",  "gif": "image/gif",
+    "svg": "image/svg+xml",
+}
+_REMOTE_LOGO_TTL = 3600  # seconds
+_remote_logos: dict = {}  # url -> (expires_at, data_uri)
+
+# pooled session so remote logo fetches reuse keep-alive TLS connections
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+_HTTP.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
+
+@lru_cache(maxsize=256)
+def _local_logo(path: str, mtime_ns: int) -> Optional[str]:
+    """file:// URL for a logo on disk; wkhtmltopdf reads it itself (enable-local-file-access).
+
+    The upload path is fixed per user, so mtime_ns goes into the fragment: a
+    replaced logo changes the HTML and with it the PDF cache key / ETag.
+    """
+    try:
+        return Path(path).resolve().as_uri() + f"#v={mtime_ns}"
+    except Exception:
+        return None
+
+
+def _remote_logo(url: str) -> Optional[str]:
+    hit = _remote_logos.get(url)
+    now = time.monotonic()
+    if hit and hit[0] > now:
+        return hit[1]
+    try:
+        r = _HTTP.get(url, timeout=5)
+        if not (r.ok and r.content):
+            return None
+    except Exception:
+        return None
+    # crude mime guess from URL
+    mime = "image/png"
+    for ext, mm in _LOGO_MIME.items():
+        if url.lower().endswith(ext):
+            mime = mm; break
+    data_uri = f"data:{mime};base64,{b64encode(r.content).decode('ascii')}"
+    if len(_remote_logos) >= 256:
+        _remote_logos.clear()
+    _remote_logos[url] = (now + _REMOTE_LOGO_TTL, data_uri)
+    return data_uri
+
+
+def _logo_sources(org_logo: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(data_uri, file_url) for the org logo: remote logos are embedded, local ones linked."""
+    try:
+        if not isinstance(org_logo, str) or not org_logo:
+            return None, None
+        if org_logo.startswith("/static/"):
+            logo_fs = _PROJECT_ROOT / org_logo.lstrip("/")
+        elif org_logo.lower().startswith(("http://", "https://")):
+            return _remote_logo(org_logo), None
+        elif "static/" in org_logo:
+            # handle cases like 'static/uploads/logo/x.png'
+            logo_fs = _PROJECT_ROOT / org_logo
+        else:
+            return None, None
+        if not logo_fs.is_file():
+            return None, None
+        return None, _local_logo(str(logo_fs), logo_fs.stat().st_mtime_ns)
+    except Exception:
+        return None, None
+
+
+def render_statement_pdf_html_for_customer(
     db: Session,
     user_id: int,
     customer_id: int,
     date_to: Optional[str] = None,
     include_after_payments: bool = False,
-) -> Optional[str]:
+) -> Tuple[Optional[str], Optional[Customer]]:
     """
-    Build a minimal, self-contained HTML for the customer's statement suitable for PDF rendering.
-    Returns the HTML string or None if data can't be prepared.
+    Same as render_statement_pdf_html, but also returns the Customer it loaded
+    so callers (e.g. the PDF filename) don't have to query it again.
+    Returns (None, None) if data can't be prepared.
     """
     try:
-        # Branding
-        org = db.query(AppSettings).filter(AppSettings.user_id == user_id).first()
-        org_addr = getattr(org, "org_address", None) or ""
-        org_logo = getattr(org, "org_logo_url", None) or None
-        org_logo_data_uri: Optional[str] = None
-        org_logo_file_url: Optional[str] = None
-
-        # Try to embed logo as data URI (local static or HTTP)
-        try:
-            if isinstance(org_logo, str) and org_logo:
-                project_root = Path(__file__).resolve().parents[2]
-                raw: bytes | None = None
-                mime = "image/png"
-
-                if org_logo.startswith("/static/"):
-                    logo_fs = project_root / org_logo.lstrip("/")
-                    if logo_fs.is_file():
-                        raw = logo_fs.read_bytes()
-                        ext = (logo_fs.suffix or ".png").lower().lstrip(".")
-                        mime = {
-                            "jpg": "image/jpeg", "jpeg": "image/jpeg",
-                            "png": "image/png",  "gif": "image/gif",
-                            "svg": "image/svg+xml",
-                        }.get(ext, "image/png")
-                        try:
-                            org_logo_file_url = "file:///" + str(logo_fs.resolve()).replace('\\','/')
-                        except Exception:
-                            pass
-                elif org_logo.lower().startswith(("http://", "https://")):
-                    try:
-                        r = requests.get(org_logo, timeout=5)
-                        if r.ok:
-                            raw = r.content
-                            # crude mime guess from URL
-                            for ext, mm in {"jpg":"image/jpeg","jpeg":"image/jpeg","png":"image/png","gif":"image/gif","svg":"image/svg+xml"}.items():
-                                if org_logo.lower().endswith(ext):
-                                    mime = mm; break
-                    except Exception:
-                        pass
-                elif "static/" in org_logo:
-                    # handle cases like 'static/uploads/logo/x.png'
-                    logo_fs = project_root / org_logo
-                    if logo_fs.is_file():
-                        raw = logo_fs.read_bytes()
-                        ext = (logo_fs.suffix or ".png").lower().lstrip(".")
-                        mime = {
-                            "jpg": "image/jpeg", "jpeg": "image/jpeg",
-                            "png": "image/png",  "gif": "image/gif",
-                            "svg": "image/svg+xml",
-                        }.get(ext, "image/png")
-                        try:
-                            org_logo_file_url = "file:///" + str(logo_fs.resolve()).replace('\\','/')
-                        except Exception:
-                            pass
-
-                if raw:
-                    org_logo_data_uri = f"data:{mime};base64,{b64encode(raw).decode('ascii')}"
-        except Exception:
-            pass
-
-        cust = (
-            db.query(Customer)
+        # Customer (ownership-checked) and branding in one round trip
+        row = (
+            db.query(Customer, AppSettings)
+              .outerjoin(AppSettings, AppSettings.user_id == Customer.user_id)
               .filter(Customer.id == customer_id, Customer.user_id == user_id)
               .first()
         )
-        if not cust:
-            return None
+        if not row:
+            return None, None
+        cust, org = row
+        org_addr = getattr(org, "org_address", None) or ""
+        org_logo = getattr(org, "org_logo_url", None) or None
+
+        # HTTP logos are embedded as a data URI; local ones go in as a file:// URL
+        org_logo_data_uri, org_logo_file_url = _logo_sources(org_logo)
 
         summary = compute_statement_summary(
             db=db,
@@ -101,10 +133,10 @@ def render_statement_pdf_html(
             customer_id=customer_id,
             date_to=date_to,
             include_after_payments=include_after_payments,
+            customer=cust,
         )
 
-        tpl = templates.env.get_template("pdf/statement_pdf.html")
-        html = tpl.render(
+        html = _STATEMENT_TPL.render(
             org_address=org_addr,
             org_logo_url=org_logo,
             org_logo_data_uri=org_logo_data_uri,
@@ -112,17 +144,104 @@ def render_statement_pdf_html(
             customer=cust,
             summary=summary,
         )
-        return html
+        return html, cust
     except Exception as e:
         log.warning("Failed to render statement HTML: %s", e)
+        return None, None
+
+
+def render_statement_pdf_html(
+    db: Session,
+    user_id: int,
+    customer_id: int,
+    date_to: Optional[str] = None,
+    include_after_payments: bool = False,
+) -> Optional[str]:
+    """
+    Build a minimal, self-contained HTML for the customer's statement suitable for PDF rendering.
+    Returns the HTML string or None if data can't be prepared.
+    """
+    html, _ = render_statement_pdf_html_for_customer(
+        db, user_id, customer_id, date_to, include_after_payments
+    )
+    return html
+
+
+def html_cache_key(html: str) -> str:
+    return sha256(html.encode("utf-8")).hexdigest()
+
+
+def _pdf_cache_dir_ok() -> bool:
+    """
+    Create the cache dir owner-only (statements hold customer financial data,
+    and the default lives under the shared temp dir). A pre-existing dir is
+    tightened to 0700; one owned by another user is not used at all.
+    """
+    try:
+        _PDF_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = _PDF_CACHE_DIR.stat()
+        if hasattr(os, "getuid") and st.st_uid != os.getuid():
+            log.warning("PDF cache dir %s is not owned by this user; cache disabled", _PDF_CACHE_DIR)
+            return False
+        if st.st_mode & 0o077:
+            os.chmod(_PDF_CACHE_DIR, 0o700)
+        return True
+    except OSError as e:
+        log.warning("PDF cache dir unavailable: %s", e)
+        return False
+
+
+def _pdf_cache_get(key: str) -> Optional[bytes]:
+    if not _pdf_cache_dir_ok():
+        return None
+    path = _PDF_CACHE_DIR / f"{key}.pdf"
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # bump mtime: eviction drops the least recently used
+        return data or None
+    except OSError:
         return None
 
 
-def render_pdf_from_html(html: str) -> Optional[bytes]:
+def _pdf_cache_put(key: str, pdf: bytes) -> None:
+    if not _pdf_cache_dir_ok():
+        return
+    try:
+        tmp = _PDF_CACHE_DIR / f"{key}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(pdf)
+        os.replace(tmp, _PDF_CACHE_DIR / f"{key}.pdf")
+
+        # keep the directory under its byte budget, oldest first
+        files = []
+        for f in _PDF_CACHE_DIR.glob("*.pdf"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue  # evicted by another worker meanwhile
+            files.append((st.st_mtime, st.st_size, f))
+        total = sum(size for _, size, _ in files)
+        for _, size, f in sorted(files):
+            if total <= _PDF_CACHE_MAX_BYTES:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+    except OSError as e:
+        log.warning("PDF cache write failed: %s", e)
+
+
+def render_pdf_from_html(html: str, cache_key: Optional[str] = None) -> Optional[bytes]:
     """
     HTML -> PDF using wkhtmltopdf (via pdfkit). Returns PDF bytes or None on failure.
     Configure binary via env WKHTMLTOPDF_PATH or ensure it's on PATH.
+    Identical HTML is served from the on-disk cache (STATEMENT_PDF_CACHE_DIR);
+    pass cache_key if the caller already has html_cache_key(html).
     """
+    key = cache_key or html_cache_key(html)
+    cached = _pdf_cache_get(key)
+    if cached:
+        return cached
     try:
         import pdfkit
         exe = os.getenv("WKHTMLTOPDF_PATH")
@@ -130,7 +249,9 @@ def render_pdf_from_html(html: str) -> Optional[bytes]:
         options = {"quiet": "", "enable-local-file-access": ""}
         pdf_bytes = pdfkit.from_string(html, False, configuration=cfg, options=options)
         if isinstance(pdf_bytes, (bytes, bytearray)) and pdf_bytes:
-            return bytes(pdf_bytes)
+            pdf = bytes(pdf_bytes)
+            _pdf_cache_put(key, pdf)
+            return pdf
     except Exception as e:
         log.warning("wkhtmltopdf PDF render failed: %s", e)
     return None
@@ -1,8 +1,8 @@
 # app/services/statements_logic.py
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
 from typing import Optional, Dict, List
 
-from sqlalchemy import func, case
+from sqlalchemy import func, case, select
 from sqlalchemy.orm import Session
 
 from ..schemas.statements import (
@@ -18,8 +18,9 @@ def compute_statement_summary(
     customer_id: int,
     date_to: Optional[str] = None,
     include_after_payments: bool = False,
+    customer: Optional[Customer] = None,   # already loaded + ownership-checked by the caller
 ) -> StatementOut:
-    cust = (
+    cust = customer or (
         db.query(Customer)
           .filter(Customer.id == customer_id, Customer.user_id == user_id)
           .first()
@@ -31,47 +32,57 @@ def compute_statement_summary(
     if date_to:
         as_of = datetime.fromisoformat(date_to).date()
 
+    # plain range on the timestamp column (no DATE() wrapper) so the
+    # (customer_id, issue_date / received_at) indexes can be used
+    before = datetime.combine(as_of + timedelta(days=1), time.min)
+
     def on_or_before(col_dt):
-        return func.date(col_dt) <= as_of
+        return col_dt < before
 
+    # allocations per invoice as of the cut-off, joined straight onto the
+    # invoices; fully-paid invoices are dropped server-side
     alloc_q = (
-        db.query(
+        select(
             PaymentAllocation.invoice_id.label("invoice_id"),
-            func.coalesce(func.sum(PaymentAllocation.amount), 0).label("alloc_sum"),
+            func.sum(PaymentAllocation.amount).label("alloc_sum"),
         )
         .join(Payment, Payment.id == PaymentAllocation.payment_id)
-        .filter(Payment.customer_id == customer_id)
-        .filter(Payment.kind.in_(["payment", "refund"]))
+        .where(Payment.customer_id == customer_id)
+        .where(Payment.kind.in_(["payment", "refund"]))
     )
     if not include_after_payments:
-        alloc_q = alloc_q.filter(on_or_before(Payment.received_at))
-    alloc_q = alloc_q.group_by(PaymentAllocation.invoice_id)
-
-    alloc_map: Dict[int, float] = {
-        row.invoice_id: float(row.alloc_sum or 0.0) for row in alloc_q.all()
-    }
-
-    inv_q = (
-        db.query(Invoice)
-        .filter(
+        alloc_q = alloc_q.where(on_or_before(Payment.received_at))
+    alloc_sq = alloc_q.group_by(PaymentAllocation.invoice_id).subquery()
+    paid_col = func.coalesce(alloc_sq.c.alloc_sum, 0)
+
+    invoices = db.execute(
+        select(
+            Invoice.id,
+            Invoice.invoice_number,
+            Invoice.issue_date,
+            Invoice.due_date,
+            Invoice.amount_due,
+            paid_col.label("paid"),
+        )
+        .outerjoin(alloc_sq, alloc_sq.c.invoice_id == Invoice.id)
+        .where(
             Invoice.customer_id == customer_id,
             Invoice.kind == "invoice",
             on_or_before(Invoice.issue_date),
+            func.coalesce(Invoice.amount_due, 0) - paid_col > 0.0001,
         )
-    )
-    invoices = inv_q.all()
+    ).all()
 
-    buckets = {"ov_0_30": 0.0, "ov_31_60": 0.0, "ov_61_90": 0.0, "ov_90p": 0.0}
+    # overdue 1-30 / 31-60 / 61-90 / 90+ days, indexed by (days - 1) // 30
+    buckets = [0.0, 0.0, 0.0, 0.0]
     total_outstanding_gross = 0.0
     overdue_total = 0.0
     open_items: List[OpenInvoiceOut] = []
 
     for inv in invoices:
         total = float(inv.amount_due or 0.0)
-        paid_as_of = float(alloc_map.get(inv.id, 0.0))
+        paid_as_of = float(inv.paid or 0.0)
         outstanding = max(0.0, total - paid_as_of)
-        if outstanding <= 0.0001:
-            continue
 
         issue_dt = inv.issue_date.date() if inv.issue_date else None
         due_dt = inv.due_date.date() if inv.due_date else (issue_dt or as_of)
@@ -83,20 +94,14 @@ def compute_statement_summary(
 
         if days_overdue > 0:
             overdue_total += outstanding
-            if days_overdue <= 30:
-                buckets["ov_0_30"] += outstanding
-            elif days_overdue <= 60:
-                buckets["ov_31_60"] += outstanding
-            elif days_overdue <= 90:
-                buckets["ov_61_90"] += outstanding
-            else:
-                buckets["ov_90p"] += outstanding
+            buckets[min((days_overdue - 1) // 30, 3)] += outstanding
 
+        # values are computed here, so skip per-row field validation
         open_items.append(
-            OpenInvoiceOut(
+            OpenInvoiceOut.construct(
                 id=inv.id,
-                ref=getattr(inv, "invoice_number", str(inv.id)),
-                desc=f"Invoice {getattr(inv, 'invoice_number', inv.id)}",
+                ref=inv.invoice_number,
+                desc=f"Invoice {inv.invoice_number}",
                 issue_date=issue_dt.isoformat() if issue_dt else None,
                 due_date=due_dt.isoformat() if due_dt else None,
                 total=round(total, 2),
@@ -106,8 +111,9 @@ def compute_statement_summary(
             )
         )
 
-    payments_sum_q = (
-        db.query(
+    # net payments and allocated total in one round trip (two scalar subqueries)
+    payments_net_q = (
+        select(
             func.coalesce(
                 func.sum(
                     case(
@@ -118,20 +124,21 @@ def compute_statement_summary(
                 0.0,
             )
         )
-        .filter(Payment.customer_id == customer_id)
+        .where(Payment.customer_id == customer_id)
     )
-    if not include_after_payments:
-        payments_sum_q = payments_sum_q.filter(on_or_before(Payment.received_at))
-    total_payments_net = float(payments_sum_q.scalar() or 0.0)
-
     alloc_total_q = (
-        db.query(func.coalesce(func.sum(PaymentAllocation.amount), 0.0))
+        select(func.coalesce(func.sum(PaymentAllocation.amount), 0.0))
         .join(Payment, Payment.id == PaymentAllocation.payment_id)
-        .filter(Payment.customer_id == customer_id)
+        .where(Payment.customer_id == customer_id)
     )
     if not include_after_payments:
-        alloc_total_q = alloc_total_q.filter(on_or_before(Payment.received_at))
-    total_allocated = float(alloc_total_q.scalar() or 0.0)
+        payments_net_q = payments_net_q.where(on_or_before(Payment.received_at))
+        alloc_total_q = alloc_total_q.where(on_or_before(Payment.received_at))
+    payments_net, allocated = db.execute(
+        select(payments_net_q.scalar_subquery(), alloc_total_q.scalar_subquery())
+    ).one()
+    total_payments_net = float(payments_net or 0.0)
+    total_allocated = float(allocated or 0.0)
 
     unallocated_credits = max(0.0, total_payments_net - total_allocated)
     balance_due = max(0.0, total_outstanding_gross - unallocated_credits)
@@ -147,10 +154,10 @@ def compute_statement_summary(
             overdue_total=round(overdue_total, 2),
         ),
         buckets=BucketsOut(
-            overdue_0_30=round(buckets["ov_0_30"], 2),
-            overdue_31_60=round(buckets["ov_31_60"], 2),
-            overdue_61_90=round(buckets["ov_61_90"], 2),
-            overdue_90p=round(buckets["ov_90p"], 2),
+            overdue_0_30=round(buckets[0], 2),
+            overdue_31_60=round(buckets[1], 2),
+            overdue_61_90=round(buckets[2], 2),
+            overdue_90p=round(buckets[3], 2),
         ),
         open_invoices=open_items,
     )
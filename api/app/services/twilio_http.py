@@ -0,0 +1,16 @@
+# app/services/twilio_http.py
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One pooled session for all Twilio calls so provisioning and webhook lookups
+# reuse keep-alive TLS connections. Retry covers idempotent verbs only.
+twilio_http = requests.Session()
+twilio_http.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=50,
+        max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+    ),
+)
@@ -9,6 +9,7 @@ from fastapi import (
     Query,
 )
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 
 # Pydantic
 from pydantic import BaseModel, Field, EmailStr
@@ -20,8 +21,13 @@ from sqlalchemy.orm import Session
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 TEMPLATES_DIR = PROJECT_ROOT / "web" / "templates"
 
-# Single Jinja2Templates instance shared across routers
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+# Single Jinja2Templates instance shared across routers.
+# Compiled template bytecode is kept on disk (system temp dir) so a fresh
+# worker doesn't re-parse every template on first use.
+templates = Jinja2Templates(
+    directory=str(TEMPLATES_DIR),
+    bytecode_cache=FileSystemBytecodeCache(),
+)
 
 # Re-export for convenience
 __all__ = [
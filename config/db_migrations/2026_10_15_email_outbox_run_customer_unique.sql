@@ -0,0 +1,8 @@
+-- At most one outbox job per (statement run, customer), so re-enqueueing an
+-- existing run is a no-op per customer. Non-statement rows have a NULL run_id,
+-- which a unique key never treats as equal.
+-- Check for existing duplicates first; this returns no rows on a clean outbox:
+--   SELECT run_id, customer_id, COUNT(*) FROM email_outbox
+--   WHERE run_id IS NOT NULL GROUP BY 1, 2 HAVING COUNT(*) > 1;
+ALTER TABLE email_outbox
+    ADD UNIQUE KEY uq_outbox_run_customer (run_id, customer_id);
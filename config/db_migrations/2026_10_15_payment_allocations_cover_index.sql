@@ -0,0 +1,3 @@
+-- Statement summary/ledger sum allocations by payment; covering so they read only the index
+-- (InnoDB builds it online; MySQL has no INCLUDE, so the covered columns are key parts)
+CREATE INDEX ix_payment_allocations_payment_cover ON payment_allocations (payment_id, invoice_id, amount);
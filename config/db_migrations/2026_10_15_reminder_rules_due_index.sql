@@ -0,0 +1,2 @@
+-- enqueue-due selects due statement rules FOR UPDATE SKIP LOCKED; this index keeps the scanned (and locked) range to due rules
+CREATE INDEX ix_reminder_rules_due ON reminder_rules (reminder_type, reminder_enabled, reminder_next_run_utc);
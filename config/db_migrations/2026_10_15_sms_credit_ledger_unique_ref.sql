@@ -0,0 +1,7 @@
+-- At most one ledger row per (user, entry type, Twilio message SID).
+-- Credits have a NULL reference_id, which a unique key never treats as equal.
+-- Check for existing duplicates first; this returns no rows on a clean ledger:
+--   SELECT user_id, entry_type, reference_id, COUNT(*) FROM sms_credit_ledger
+--   WHERE reference_id IS NOT NULL GROUP BY 1, 2, 3 HAVING COUNT(*) > 1;
+ALTER TABLE sms_credit_ledger
+    ADD UNIQUE KEY uq_sms_credit_ledger_ref (user_id, entry_type, reference_id);
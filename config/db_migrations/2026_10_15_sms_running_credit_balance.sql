@@ -0,0 +1,19 @@
+-- Keep account_sms_settings.credits_balance as the running SMS credit balance
+CREATE INDEX ix_sms_credit_ledger_user_type ON sms_credit_ledger (user_id, entry_type);
+
+-- Accounts that only ever had a stored balance get an opening ledger entry
+INSERT INTO sms_credit_ledger (user_id, entry_type, amount, reason, created_at)
+SELECT s.user_id, 'credit', s.credits_balance, 'opening_balance', NOW()
+FROM account_sms_settings s
+WHERE s.credits_balance > 0
+  AND NOT EXISTS (SELECT 1 FROM sms_credit_ledger l WHERE l.user_id = s.user_id);
+
+-- Stored balance = ledger total for every account with ledger rows
+UPDATE account_sms_settings s
+JOIN (
+    SELECT user_id,
+           SUM(CASE WHEN entry_type = 'credit' THEN amount ELSE -amount END) AS balance
+    FROM sms_credit_ledger
+    GROUP BY user_id
+) l ON l.user_id = s.user_id
+SET s.credits_balance = l.balance;
@@ -0,0 +1,3 @@
+-- Status/inbound webhooks look up the account by subaccount SID or number
+CREATE INDEX ix_account_sms_settings_twilio_subaccount_sid ON account_sms_settings (twilio_subaccount_sid);
+CREATE INDEX ix_account_sms_settings_twilio_phone_number ON account_sms_settings (twilio_phone_number);
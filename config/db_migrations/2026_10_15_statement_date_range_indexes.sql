@@ -0,0 +1,3 @@
+-- Statement ledger/summary filter a customer's invoices/payments by a timestamp range
+CREATE INDEX ix_invoices_customer_issue ON invoices (customer_id, issue_date);
+CREATE INDEX ix_payments_customer_received ON payments (customer_id, received_at);
@@ -2,6 +2,8 @@
 import os
 import base64
 import binascii
+from functools import lru_cache
+from typing import Optional, Tuple
 
 
 def redacted(v: str, keep: int = 4) -> str:
@@ -19,20 +21,26 @@ key = os.getenv("APP_SECRETS_KEY")
 print("POSTMARK_SERVER_TOKEN_DEFAULT:", redacted(pmt))
 print("APP_SECRETS_KEY:", redacted(key))
 
-ok = False
-note = None
-
-if key:
+@lru_cache(maxsize=4)
+def _check(key: str) -> Tuple[bool, Optional[str]]:
     s = key.strip()
+    # 32 bytes is exactly 44 padded base64 chars, and b64decode(validate=True)
+    # rejects unpadded input, so any other length can't be valid
+    if len(s) != 44:
+        return False, f"encoded length = {len(s)} (expected 44 for 32 bytes)"
     try:
         raw = base64.b64decode(s, validate=True)
-        ok = (len(raw) == 32)
-        if not ok:
-            note = f"decoded length = {len(raw)} (expected 32)"
     except (binascii.Error, ValueError) as e:
-        note = f"decode failed: {e!s}"
+        return False, f"decode failed: {e!s}"
+    if len(raw) != 32:
+        return False, f"decoded length = {len(raw)} (expected 32)"
+    return True, None
+
+
+if key:
+    ok, note = _check(key)
 else:
-    note = "APP_SECRETS_KEY not set"
+    ok, note = False, "APP_SECRETS_KEY not set"
 
 print("APP_SECRETS_KEY valid 32 bytes:", ok)
 if note: